@@ -1,12 +1,17 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime as dt
 import calendar
+import csv
 from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import jpholiday
 import os
 import shutil
-import html
+import html as html_module
 from streamlit_gsheets import GSheetsConnection
 
 # =========================================================
@@ -22,10 +27,17 @@ WEEKDAY_REQUIRED_STAFF = 5
 WEEKEND_REQUIRED_STAFF = 6
 REQUIRED_EMPLOYEES = 2
 
+def parse_date_str(s: str) -> dt.date:
+    """「YYYY-MM-DD」を日付にする。速い fromisoformat を先に試し、ゼロ埋めなし（2026-2-5）は strptime で読む"""
+    try:
+        return dt.date.fromisoformat(s)
+    except ValueError:
+        return dt.datetime.strptime(s, "%Y-%m-%d").date()
+
 # 【追加】祝日判定関数を読込より前に定義
 def get_jp_holiday_name(date_obj: dt.date) -> str | None:
     if isinstance(date_obj, str):
-        date_obj = dt.datetime.strptime(date_obj, "%Y-%m-%d").date()
+        date_obj = parse_date_str(date_obj)
     name = jpholiday.is_holiday_name(date_obj)
     return name if name else None
 
@@ -49,28 +61,45 @@ MESSAGE_FILE = DATA_DIR / "messages.csv"
 # =========================================================
 # 2. GSheets連携エンジン (秘密鍵の読み込みエラー対策版)
 # =========================================================
-def get_gsheets_connection():
+@st.cache_resource(show_spinner=False)
+def get_gsheets_connection() -> tuple:
+    """
+    (接続, エラー内容) を返す。失敗時は (None, 例外)。
+    キャッシュ関数の中なので st.* の表示はしない（表示は report_gsheets_connection_error で行う）。
+    接続は初めて必要になった時に1回だけ作り、失敗した結果も再実行をまたいで覚えておく。
+    """
     try:
         # Secretsから接続情報を読み込む
-        return st.connection("gsheets", type=GSheetsConnection)
+        return st.connection("gsheets", type=GSheetsConnection), None
     except Exception as e:
-        # 【修正点】Invalid PEMエラーが出た場合、より具体的な対策を表示
-        err_msg = str(e)
-        if "PEM" in err_msg or "InvalidData" in err_msg:
-            st.sidebar.error("Secretsのprivate_keyが不正です。ダブルクォーテーションで囲んでいるか確認してください。")
-        else:
-            st.sidebar.error(f"GSheets接続エラー: {e}")
-        return None
+        return None, e
 
-conn = get_gsheets_connection()
-IS_CLOUD_READY = conn is not None
+def _get_conn():
+    return get_gsheets_connection()[0]
 
-def load_csv(path: Path, columns: list) -> pd.DataFrame:
+def report_gsheets_connection_error():
+    """GSheets 接続に失敗していればサイドバーにエラーを出す（ページ本体から1回だけ呼ぶ）"""
+    _, e = get_gsheets_connection()
+    if e is None:
+        return
+    # 【修正点】Invalid PEMエラーが出た場合、より具体的な対策を表示
+    err_msg = str(e)
+    if "PEM" in err_msg or "InvalidData" in err_msg:
+        st.sidebar.error("Secretsのprivate_keyが不正です。ダブルクォーテーションで囲んでいるか確認してください。")
+    else:
+        st.sidebar.error(f"GSheets接続エラー: {e}")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_csv_cached(path_str: str, columns_tuple: tuple) -> pd.DataFrame:
+    """load_csv の実体。再実行ごとに GSheets へ取りに行かないようキャッシュする"""
+    path = Path(path_str)
+    columns = list(columns_tuple)
     sheet_name = path.stem
     df = None
-    if conn:
+    c = _get_conn()
+    if c:
         try:
-            df = conn.read(worksheet=sheet_name, ttl=0)
+            df = c.read(worksheet=sheet_name, ttl=0)
         except Exception:
             pass
     if df is None or df.empty:
@@ -81,50 +110,217 @@ def load_csv(path: Path, columns: list) -> pd.DataFrame:
     for col in columns:
         if col not in df.columns:
             df[col] = 0 if col in ["pay", "hours", "late_hours"] else None
-    return df[columns]
+    df = df[columns].copy()
+    # staff_id 系の列はここで一度だけ文字列にそろえる（以降の比較で毎回 astype(str) しない）
+    for col in ("staff_id", "from_staff_id", "to_staff_id"):
+        if col in df.columns:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    # 値の種類が少ないラベル列はカテゴリ型にして比較・集計を軽くする
+    for col in ("request_type", "source"):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    # 月での絞り込み用に日付型の列を持たせておく（保存時には落とす）
+    if "date" in df.columns:
+        df = df.assign(_date=pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce"))
+    return df
 
-def save_csv(df: pd.DataFrame, path: Path):
-    """保存処理"""
-    sheet_name = path.stem
-    df.to_csv(path, index=False, encoding="utf-8-sig")
-    if conn:
+@st.cache_resource
+def _io_pool() -> ThreadPoolExecutor:
+    """GSheets への書き込み用スレッド（1本にして同じシートへの更新順を保つ）"""
+    return ThreadPoolExecutor(max_workers=1)
+
+def _sync_to_gsheets(conn, sheet_name: str, df: pd.DataFrame):
+    """バックグラウンドで実行される GSheets 更新。st.* はここでは呼ばない"""
+    conn.update(worksheet=sheet_name, data=df)
+
+@st.cache_resource
+def _gsheets_sync_state() -> dict:
+    """全セッション共通の同期待ち状態（シート名 → 最後に投入した書き込み）"""
+    return {"lock": threading.Lock(), "pending": {}}
+
+def _submit_gsheets_sync(sheet_name: str, fn, *args):
+    """
+    GSheets への書き込みをバックグラウンドに投げる。
+    同期待ちは全セッションで共有し、書き込みが終わった時点で読み込みキャッシュを捨てる
+    （同期中に他のセッションが古いシートを読んでキャッシュしても、完了時に消える）。
+    """
+    state = _gsheets_sync_state()
+    future = _io_pool().submit(fn, *args)
+    with state["lock"]:
+        state["pending"][sheet_name] = future
+
+    def _on_done(f):
+        _load_csv_cached.clear()
+        with state["lock"]:
+            if state["pending"].get(sheet_name) is f:
+                del state["pending"][sheet_name]
+
+    future.add_done_callback(_on_done)
+    # 結果の表示はこのセッションで行う
+    st.session_state.setdefault("_gsheets_sync", {})[sheet_name] = future
+
+def _wait_gsheets_sync(sheet_name: str):
+    """どのセッションの書き込みでも、同期待ちがあれば終わるまで待つ（古いシートを読まないため）"""
+    state = _gsheets_sync_state()
+    with state["lock"]:
+        future = state["pending"].get(sheet_name)
+    if future is not None:
         try:
-            conn.update(worksheet=sheet_name, data=df)
+            future.result()
+        except Exception:
+            pass  # 結果の表示は書き込んだセッションの _report_gsheets_sync で行う
+
+def _report_gsheets_sync():
+    """完了したバックグラウンド同期の結果をトースト / エラーで表示する"""
+    pending = st.session_state.get("_gsheets_sync", {})
+    for sheet_name, future in list(pending.items()):
+        if not future.done():
+            continue
+        del pending[sheet_name]
+        e = future.exception()
+        if e is None:
             st.toast(f"Synced: {sheet_name}")
-        except Exception as e:
+        elif "Service Account" in str(e):
             # 認証エラー時は警告のみ出す
-            if "Service Account" in str(e):
-                st.error("【要設定】スプレッドシートへの書込権限がありません。Secretsの設定を確認してください。")
-            else:
-                st.error(f"保存失敗: {e}")
+            st.error("【要設定】スプレッドシートへの書込権限がありません。Secretsの設定を確認してください。")
+        else:
+            st.error(f"保存失敗: {e}")
+
+def load_csv(path: Path, columns: list) -> pd.DataFrame:
+    _wait_gsheets_sync(path.stem)
+    # st.cache_data は呼び出しごとにコピーを返すので、呼び出し側で加工しても キャッシュ本体は汚れない
+    return _load_csv_cached(str(path), tuple(columns))
+
+# 文字列と数値だけの小さな表なので、標準の csv モジュールで直接書き出すファイル
+_FAST_CSV_FILES = {STAFF_FILE, SHIFT_FILE, REQUEST_FILE, TIMECARD_FILE, MESSAGE_FILE}
+
+def _fast_write_csv(df: pd.DataFrame, path: Path):
+    """DataFrame.to_csv を通さずに書き出す（欠損値は to_csv と同じく空欄）"""
+    values = df.astype(object).where(df.notna(), None)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(df.columns)
+        w.writerows(values.itertuples(index=False, name=None))
+
+def save_csv(df: pd.DataFrame, path: Path):
+    """保存処理（ローカルは一時ファイル経由で置き換え、GSheets はバックグラウンドで同期）"""
+    sheet_name = path.stem
+    df = df.drop(columns=["_date"], errors="ignore")
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if path in _FAST_CSV_FILES:
+        _fast_write_csv(df, tmp)
+    else:
+        df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, path)
+    # 同期待ちを登録してからキャッシュを捨てる（間に古いシートを読まれないように）
+    conn = _get_conn()
+    if conn:
+        _submit_gsheets_sync(sheet_name, _sync_to_gsheets, conn, sheet_name, df.copy())
+    _load_csv_cached.clear()
+
+def _append_and_sync_to_gsheets(conn, sheet_name: str, df: pd.DataFrame, row: dict):
+    """バックグラウンドで1行足した全体をシートへ書き込む"""
+    full = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+    _sync_to_gsheets(conn, sheet_name, full)
+
+def append_row_csv(df: pd.DataFrame, path: Path, row: dict, columns: list):
+    """
+    1行追加の保存処理。
+    ローカルCSVは末尾に1行書き足すだけにして、読み込み→結合→全書き換えを避ける。
+    （GSheets には全体が必要なので、結合と同期はバックグラウンドで行う）
+    df は読み込み済みの現在の内容（GSheets 同期用）。
+    """
+    header = None
+    if path.exists():
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            header = next(csv.reader(f), None)
+    if header is not None and header != list(columns):
+        # 列構成が違う古いCSVは、従来通り全体を書き直す
+        save_csv(pd.concat([df, pd.DataFrame([row])], ignore_index=True), path)
+        return
+
+    # 新規ファイルは BOM 付きでヘッダーから書く（save_csv と同じ形式）
+    encoding = "utf-8" if header is not None else "utf-8-sig"
+    with open(path, "a", encoding=encoding, newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, lineterminator="\n")
+        if header is None:
+            writer.writeheader()
+        writer.writerow(row)
+
+    # 同期待ちを登録してからキャッシュを捨てる（save_csv と同じ順番）
+    conn = _get_conn()
+    if conn:
+        sheet_name = path.stem
+        base = df.drop(columns=["_date"], errors="ignore")[columns].copy()
+        _submit_gsheets_sync(sheet_name, _append_and_sync_to_gsheets, conn, sheet_name, base, row)
+    _load_csv_cached.clear()
 
 # 初期化
+# スタッフマスタの整数列と型（CSV では空欄になり得るので欠損ありの整数型）
+STAFF_NULLABLE_DTYPES = {
+    "hourly_wage": "Int32",
+    "desired_shifts_per_month": "Int32",
+    "desired_shifts_per_week": "Int32",
+    "desired_monthly_income": "Int32",
+    "dayoff1": "Int8",
+    "dayoff2": "Int8",
+}
+
 def load_staff_master() -> pd.DataFrame:
     df = load_csv(Path(STAFF_FILE), FILE_SCHEMA["staff_master"])
     if df.empty:
         STAFF_MASTER = [("S001", "宮首（店長）", "社員", 1500, 5, 280000, "店長", None, None, 22, 0)]
         df = pd.DataFrame(STAFF_MASTER, columns=FILE_SCHEMA["staff_master"])
         save_csv(df, Path(STAFF_FILE))
+    # 空欄が混ざる数値列は、読み込み時に一度だけ欠損ありの整数型（Int32）にしておく
+    for col, dtype in STAFF_NULLABLE_DTYPES.items():
+        df[col] = np.trunc(pd.to_numeric(df[col], errors="coerce")).astype(dtype)
     return df
 
 STAFF_DF = load_staff_master()
 
+# スタッフ検索用の索引（staff_id / 名前 → 1行分の dict）
+_STAFF_BY_ID: dict[str, dict] = {}
+_STAFF_BY_NAME: dict[str, dict] = {}
+# staff_id → 名前（名前が空のスタッフは含めない）
+_STAFF_NAME_MAP: dict[str, str] = {}
+# 現在有効なスタッフIDの集合
+_ACTIVE_IDS: frozenset[str] = frozenset()
+
+
+def _rebuild_staff_indexes():
+    """STAFF_DF を差し替えたら必ず呼んで索引を作り直す"""
+    global _STAFF_BY_ID, _STAFF_BY_NAME, _STAFF_NAME_MAP, _ACTIVE_IDS
+    records = STAFF_DF.to_dict("records")
+    # ID / 名前が重複している場合は、従来の iloc[0] と同じく先頭の行を使う
+    _STAFF_BY_ID = {}
+    _STAFF_BY_NAME = {}
+    for r in records:
+        _STAFF_BY_ID.setdefault(str(r["staff_id"]), r)
+        _STAFF_BY_NAME.setdefault(r["name"], r)
+    _STAFF_NAME_MAP = {
+        sid: str(r["name"]) for sid, r in _STAFF_BY_ID.items() if not pd.isna(r["name"])
+    }
+    _ACTIVE_IDS = frozenset(_STAFF_BY_ID)
+
+
+_rebuild_staff_indexes()
+
 
 def get_staff_name(staff_id: str) -> str:
     """
     スタッフIDから名前を取得する。
     マスタに存在しない場合は「ID（削除済み）」と表示してエラーを防ぐ。
     """
-    rows = STAFF_DF[STAFF_DF["staff_id"] == staff_id]
-    if len(rows) == 0:
+    name = _STAFF_NAME_MAP.get(str(staff_id))
+    if name is None:
         return f"{staff_id}（削除済み）"
-    name = rows.iloc[0].get("name")
-    return str(name) if pd.notna(name) else f"{staff_id}（削除済み）"
+    return name
 
 
-def get_active_staff_ids() -> set[str]:
+def get_active_staff_ids() -> frozenset[str]:
     """現在有効なスタッフIDのセットを返す"""
-    return set(STAFF_DF["staff_id"].astype(str).tolist())
+    return _ACTIVE_IDS
 
 
 def ensure_request_ids(requests_df: pd.DataFrame) -> pd.DataFrame:
@@ -156,16 +352,16 @@ def ensure_request_ids(requests_df: pd.DataFrame) -> pd.DataFrame:
 # 共通ユーティリティ (修正版)
 # =========================
 def get_staff_by_name(name: str) -> pd.Series:
-    return STAFF_DF[STAFF_DF["name"] == name].iloc[0]
+    return pd.Series(_STAFF_BY_NAME[name])
 
 def get_staff_label(row) -> str:
     return f"{row['name']} ({row['role']})"
 
-def date_range_for_month(year: int, month: int):
-    """指定年月の全日付リスト"""
+def date_range_for_month(year: int, month: int) -> tuple[dt.date, ...]:
+    """指定年月の全日付（tuple）"""
     first_day = dt.date(year, month, 1)
     _, last_day = calendar.monthrange(year, month)
-    return [first_day + dt.timedelta(days=i) for i in range(last_day)]
+    return tuple(first_day + dt.timedelta(days=i) for i in range(last_day))
 
 def is_weekend(date_obj: dt.date) -> bool:
     # 金(4), 土(5), 日(6) を週末扱い
@@ -176,11 +372,38 @@ def format_time_str(time_obj: dt.time | None) -> str:
         return ""
     return time_obj.strftime("%H:%M")
 
+def show_paged_dataframe(df: pd.DataFrame, page_size: int, key: str, **kwargs):
+    """
+    表を page_size 行ずつに区切って表示する。
+    フロントに送るのは表示中のページだけなので、行数が増えても送信量は一定。
+    """
+    n_pages = max((len(df) - 1) // page_size + 1, 1)
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            f"ページ（全{n_pages}ページ）",
+            min_value=1,
+            max_value=n_pages,
+            value=1,
+            step=1,
+            key=f"{key}_page",
+        )
+    start = (int(page) - 1) * page_size
+    st.dataframe(df.iloc[start:start + page_size], key=key, **kwargs)
+
+def _parse_minutes(series: pd.Series) -> np.ndarray:
+    """「HH:MM」形式の列を 0時からの分数(float)の配列に変換する。欠損・解釈できない値は NaN。"""
+    s = series.astype(str).str.strip().replace({"24": "24:00"}).where(series.notna())
+    parts = s.str.split(":", n=1, expand=True).reindex(columns=[0, 1])
+    hh = pd.to_numeric(parts[0], errors="coerce").to_numpy(dtype=float)
+    mm = pd.to_numeric(parts[1], errors="coerce").to_numpy(dtype=float)
+    return hh * 60 + mm
+
 def get_jp_holiday_name(date_obj: dt.date) -> str | None:
     """日本の祝日名を返す。引数が文字列でも日付型でも対応。"""
     if isinstance(date_obj, str):
         try:
-            date_obj = dt.datetime.strptime(date_obj, "%Y-%m-%d").date()
+            date_obj = parse_date_str(date_obj)
         except:
             return None
     name = jpholiday.is_holiday_name(date_obj)
@@ -190,24 +413,8 @@ def get_jp_holiday_name(date_obj: dt.date) -> str | None:
 # =========================
 # シフト関連
 # =========================
-def build_month_calendar_html(
-    year: int,
-    month: int,
-    day_contents: dict,
-    shortage_info: dict,
-    holiday_info: dict,
-    requests_info: dict,
-) -> str:
-    """
-    day_contents:  { date_obj: [ 'りえ 17:00〜24:00', ... ] }   # 確定シフト
-    shortage_info: { date_obj: 不足人数(int) }
-    holiday_info:  { date_obj: '成人の日', ... }
-    requests_info: { date_obj: {'希望': [name...], 'NG': [name...] } }
-    """
-    cal = calendar.Calendar(firstweekday=6)  # 日曜始まり
-    weeks = cal.monthdatescalendar(year, month)
-
-    html = """
+# カレンダーの CSS と曜日ヘッダー（毎回同じなので使い回す）
+_SHIFT_CAL_CSS = """
     <style>
     table.shift-cal {
         border-collapse: collapse;
@@ -346,13 +553,78 @@ def build_month_calendar_html(
     }
 
     </style>
+"""
+
+_SHIFT_CAL_TABLE_HEAD = """
     <table class="shift-cal">
     <tr>
         <th>日</th><th>月</th><th>火</th><th>水</th><th>木</th><th>金</th><th>土</th>
     </tr>
+"""
+
+
+# render_month_calendar_with_shifts の簡易カレンダー用 CSS
+_CAL_TABLE_CSS = """
+    <style>
+    .cal-wrapper {
+        width: 100%;
+        overflow-x: auto;
+    }
+    .cal-table {
+        border-collapse: collapse;
+        width: 100%;
+        table-layout: fixed;
+    }
+    .cal-table th, .cal-table td {
+        border: 1px solid #555;
+        vertical-align: top;
+        padding: 4px;
+        font-size: 11px;
+    }
+    .cal-table th {
+        text-align: center;
+        background-color: #222;
+    }
+    .cal-daynum {
+        font-weight: bold;
+        margin-bottom: 2px;
+    }
+    .cal-cell {
+        height: 110px;
+    }
+    .cal-line {
+        margin-bottom: 2px;
+        padding: 1px 2px;
+        border-radius: 2px;
+        overflow: hidden;
+        white-space: nowrap;
+        text-overflow: ellipsis;
+    }
+    </style>
+"""
+
+
+def build_month_calendar_html(
+    year: int,
+    month: int,
+    day_contents: dict,
+    shortage_info: dict,
+    holiday_info: dict,
+    requests_info: dict,
+) -> str:
     """
+    day_contents:  { date_obj: [ 'りえ 17:00〜24:00', ... ] }   # 確定シフト
+    shortage_info: { date_obj: 不足人数(int) }
+    holiday_info:  { date_obj: '成人の日', ... }
+    requests_info: { date_obj: {'希望': [name...], 'NG': [name...] } }
+    返すのは <table> 部分だけなので、描画は render_calendar_section（CSS 付き）で行う。
+    """
+    cal = calendar.Calendar(firstweekday=6)  # 日曜始まり
+    weeks = cal.monthdatescalendar(year, month)
+
+    out = [_SHIFT_CAL_TABLE_HEAD]
     for week in weeks:
-        html += "<tr>"
+        out.append("<tr>")
         for day in week:
             classes = []
             if day.month != month:
@@ -380,44 +652,50 @@ def build_month_calendar_html(
             ng_list = req.get("NG", [])
 
             # 確定シフト
-            key = day
-            contents = day_contents.get(key, [])
             # contents はすでに HTML (<div class="cal-line ...">...</div>) の想定
-            shift_html = "".join(contents)
+            contents = day_contents.get(day, [])
 
-            class_attr = f' class="{" ".join(classes)}"' if classes else ""
-            html += f'<td{class_attr}>'
-            html += '<div class="cell-inner">'
-            html += f'<span class="day-number">{day.day}</span>'
+            if classes:
+                class_str = " ".join(classes)
+                out.append(f'<td class="{class_str}"><div class="cell-inner">')
+            else:
+                out.append('<td><div class="cell-inner">')
+            out.append(f'<span class="day-number">{day.day}</span>')
 
             # 祝日ラベル
             if is_holiday:
-                html += f'<span class="holiday-label">{holiday_name}</span>'
+                out.append(f'<span class="holiday-label">{holiday_name}</span>')
 
             # 残り枠ラベル
             if is_shortage:
-                html += f'<span class="shortage-label">残り{shortage_count}枠</span>'
+                out.append(f'<span class="shortage-label">残り{shortage_count}枠</span>')
 
             # 希望シフト（青）
             if hope_list:
                 names = ", ".join(hope_list)
-                html += f"<span class='request-hope'>希望: {names}</span>"
+                out.append(f"<span class='request-hope'>希望: {names}</span>")
 
             # NG（赤）
             if ng_list:
                 names = ", ".join(ng_list)
-                html += f"<span class='request-ng'>NG: {names}</span>"
+                out.append(f"<span class='request-ng'>NG: {names}</span>")
 
             # 確定シフト
-            if shift_html:
-                html += shift_html
+            out.extend(contents)
+
+            out.append("</div></td>")
+        out.append("</tr>")
+    out.append("</table>")
 
-            html += '</div>'
-            html += "</td>"
-        html += "</tr>"
-    html += "</table>"
+    return "".join(out)
 
-    return html
+
+def render_calendar_section(title: str, cal_html: str):
+    """区切り線・見出し・CSS・カレンダー表をまとめて1回の st.markdown で出す"""
+    st.markdown(
+        _SHIFT_CAL_CSS + f"<hr><h3>{title}</h3>" + cal_html,
+        unsafe_allow_html=True,
+    )
 
 
 def render_month_calendar_with_shifts(
@@ -430,24 +708,28 @@ def render_month_calendar_with_shifts(
     """カレンダー表示のメインロジック"""
     day_contents = {}
     
+    # 各列を配列のまま取り出しておく（iterrows は1行ごとに Series を作るので遅い）
+    dates_arr = shifts_df["date"].astype(str).to_numpy()
+    sids_arr = shifts_df["staff_id"].astype(str).to_numpy()
+    starts_arr = shifts_df["start_time"].fillna("").astype(str).to_numpy()
+    ends_arr = shifts_df["end_time"].fillna("").astype(str).to_numpy()
+
     # シフトデータを日付ごとに整理
-    for _, row in shifts_df.iterrows():
+    for date_s, sid, start in zip(dates_arr, sids_arr, starts_arr):
         try:
-            d = dt.datetime.strptime(str(row["date"]), "%Y-%m-%d").date()
-            sid = str(row["staff_id"])
-            name = get_staff_name(sid)
-            start = str(row.get("start_time") or "")
-            line = f'<div class="cal-line">{name} {start}</div>'
-            day_contents.setdefault(d, []).append(line)
-        except:
+            d = parse_date_str(date_s)
+        except ValueError:
             continue
+        name = get_staff_name(sid)
+        line = f'<div class="cal-line">{name} {start}</div>'
+        day_contents.setdefault(d, []).append(line)
 
     # 祝日情報の生成
-    holiday_info = {d: get_jp_holiday_name(d) for d in date_range_for_month(year, month) if jpholiday.is_holiday(d)}
+    holiday_info = dict(jpholiday.month_holidays(year, month))
     
     # 以前定義した build_month_calendar_html を呼び出して描画
     html_code = build_month_calendar_html(year, month, day_contents, {}, holiday_info, {})
-    st.markdown(html_code, unsafe_allow_html=True)
+    st.markdown(_SHIFT_CAL_CSS + html_code, unsafe_allow_html=True)
 
     """
     year, month と シフトDataFrame から、マス目カレンダーHTMLを描画する簡易版。
@@ -457,26 +739,22 @@ def render_month_calendar_with_shifts(
     # --- 日ごとの HTML 行を準備 ---
     day_to_lines: dict[int, list[str]] = {}
 
-    for _, row in shifts_df.iterrows():
+    for date_s, sid, start, end in zip(dates_arr, sids_arr, starts_arr, ends_arr):
         try:
-            d = dt.datetime.strptime(str(row["date"]), "%Y-%m-%d").date()
-        except Exception:
+            d = parse_date_str(date_s)
+        except ValueError:
             continue
 
         day = d.day
-        sid = str(row["staff_id"])
 
-        staff_row = STAFF_DF[STAFF_DF["staff_id"] == sid]
-        if not staff_row.empty:
-            s = staff_row.iloc[0]
+        s = _STAFF_BY_ID.get(sid)
+        if s is not None:
             name = str(s.get("name", sid))
             position = str(s.get("position") or "")
         else:
             name = sid
             position = ""
 
-        start = str(row.get("start_time") or "")
-        end = str(row.get("end_time") or "")
         time_part = f"{start}〜{end}" if (start or end) else ""
 
         # --- ポジション別の背景色 ---
@@ -497,7 +775,7 @@ def render_month_calendar_with_shifts(
 
         style = (bg_color + " " + highlight).strip()
 
-        line_html = f'<div class="cal-line" style="{style}">{html.escape(name)} {html.escape(time_part)}</div>'
+        line_html = f'<div class="cal-line" style="{style}">{html_module.escape(name)} {html_module.escape(time_part)}</div>'
 
         day_to_lines.setdefault(day, []).append(line_html)
 
@@ -506,43 +784,7 @@ def render_month_calendar_with_shifts(
     start_weekday = first_day.weekday()  # 月曜=0, 日曜=6
     _, num_days = calendar.monthrange(year, month)
 
-    html_code = """
-    <style>
-    .cal-wrapper {
-        width: 100%;
-        overflow-x: auto;
-    }
-    .cal-table {
-        border-collapse: collapse;
-        width: 100%;
-        table-layout: fixed;
-    }
-    .cal-table th, .cal-table td {
-        border: 1px solid #555;
-        vertical-align: top;
-        padding: 4px;
-        font-size: 11px;
-    }
-    .cal-table th {
-        text-align: center;
-        background-color: #222;
-    }
-    .cal-daynum {
-        font-weight: bold;
-        margin-bottom: 2px;
-    }
-    .cal-cell {
-        height: 110px;
-    }
-    .cal-line {
-        margin-bottom: 2px;
-        padding: 1px 2px;
-        border-radius: 2px;
-        overflow: hidden;
-        white-space: nowrap;
-        text-overflow: ellipsis;
-    }
-    </style>
+    html_code = _CAL_TABLE_CSS + """
     <div class="cal-wrapper">
       <table class="cal-table">
         <tr>
@@ -556,13 +798,14 @@ def render_month_calendar_with_shifts(
     html_code += "<tr>"
 
 
-def get_default_year_month_for_ui() -> tuple[int, int]:
+def get_default_year_month_for_ui(today: dt.date | None = None) -> tuple[int, int]:
     """
     UIの初期表示用に「年・月」を返す。
     - 月前半（1〜19日）：当月
     - 月後半（20日〜）：翌月
+    today を渡さなければ実行日を基準にする。
     """
-    today = dt.date.today()
+    today = today or dt.date.today()
 
     # しきい値（ここを変えれば「15日以降なら…」などに調整可能）
     THRESHOLD_DAY = 9
@@ -583,13 +826,35 @@ def get_default_year_month_for_ui() -> tuple[int, int]:
     return default_year, default_month
 
 
+def _remember_saved_shifts(df: pd.DataFrame):
+    """
+    保存直後のシフトを次の再実行に引き継ぐ。
+    GSheets への同期完了を待って読み直さずに、手元の DataFrame でそのまま再描画する。
+    """
+    df = df.reset_index(drop=True)
+    df["_date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    st.session_state["_shifts_df"] = df
+    st.session_state["_dirty_shifts"] = True
+
+
 def page_shift_calendar(current_staff):
     st.header("📅 シフト確認カレンダー")
 
 # --- 【修正箇所】必要なカラムをすべて指定して読み込む ---
     # シフト本体（給与計算済みのデータも含むためカラムを追加）
     shift_cols = ["date", "staff_id", "start_time", "end_time", "source", "hours", "late_hours", "pay"]
-    shifts_df = load_csv(SHIFT_FILE, shift_cols)
+    # 直前にこのページで保存していれば、その DataFrame を使う
+    shifts_df = st.session_state.pop("_shifts_df", None)
+    if shifts_df is None:
+        shifts_df = load_csv(SHIFT_FILE, shift_cols)
+
+    # 保存したシフトの GSheets 同期状況
+    if st.session_state.get("_dirty_shifts"):
+        pending = st.session_state.get("_gsheets_sync", {}).get(SHIFT_FILE.stem)
+        if pending is not None and not pending.done():
+            st.caption("🔄 Google Sheets と同期中です（この画面には保存内容を反映済み）")
+        else:
+            st.session_state.pop("_dirty_shifts", None)
 
     # シフト希望/NGデータ（一意なIDを含めて読み込む）
     req_cols = ["request_id", "date", "staff_id", "request_type", "start_time", "end_time", "note"]
@@ -627,10 +892,12 @@ def page_shift_calendar(current_staff):
     is_employee = current_staff["role"] == "社員"
     
     # 対象月のシフトだけに絞る
-    month_prefix = f"{year:04d}-{month:02d}-"
-    month_shifts = shifts_df[shifts_df["date"].str.startswith(month_prefix)]
+    month_mask = (shifts_df["_date"].dt.year == year) & (shifts_df["_date"].dt.month == month)
+    month_shifts = shifts_df[month_mask]
     # 対象月の希望/NGだけに絞る
-    month_requests = requests_df[requests_df["date"].str.startswith(month_prefix)]
+    month_requests = requests_df[
+        (requests_df["_date"].dt.year == year) & (requests_df["_date"].dt.month == month)
+    ]
 
     # 社員は全員分、バイトは自分の分だけ
     if not is_employee:
@@ -640,27 +907,28 @@ def page_shift_calendar(current_staff):
     target_dates = date_range_for_month(year, month)
     rows = []
     shortage_info: dict[dt.date, int] = {}
-    holiday_info: dict[dt.date, str] = {}
+    # 祝日はその月の分をまとめて取得しておく
+    holiday_info: dict[dt.date, str] = dict(jpholiday.month_holidays(year, month))
 
     # 在籍中スタッフだけを人数カウントに使う
     active_ids = get_active_staff_ids()
 
+    # 日付ごとの集計は groupby で一度だけ作っておく（日毎の全件スキャンを避ける）
+    grouped = dict(list(month_shifts.groupby("date")))
+    empty_day = month_shifts.iloc[0:0]
+
+    # 🔴 削除済みスタッフは人数カウントから除外
+    active_mask = month_shifts["staff_id"].isin(active_ids)
+    active_counts = month_shifts[active_mask].groupby("date").size().to_dict()
+
     for d in target_dates:
         day_str = d.strftime("%Y-%m-%d")
         day_of_week = "日月火水木金土"[d.weekday()]
         is_weekend_flag = is_weekend(d)
         required_staff = WEEKEND_REQUIRED_STAFF if is_weekend_flag else WEEKDAY_REQUIRED_STAFF
 
-        # 祝日判定
-        hname = get_jp_holiday_name(d)
-        if hname:
-            holiday_info[d] = hname
-
-        day_shifts = month_shifts[month_shifts["date"] == day_str]
-
-        # 🔴 削除済みスタッフは人数カウントから除外
-        active_day_shifts = day_shifts[day_shifts["staff_id"].astype(str).isin(active_ids)]
-        current_count = len(active_day_shifts)
+        day_shifts = grouped.get(day_str, empty_day)
+        current_count = active_counts.get(day_str, 0)
 
         # 残り枠（足りていれば0、オーバーでも0にしておく）
         remaining_slots = max(required_staff - current_count, 0)
@@ -669,12 +937,14 @@ def page_shift_calendar(current_staff):
         if current_count < required_staff:
             shortage_info[d] = required_staff - current_count
 
-        # 一覧表示には削除済みも含めて表示する（名前は get_staff_name で安全に）
+        # 一覧表示には削除済みも含めて表示する（マスタに無いIDは「削除済み」扱い）
         shift_summaries = []
-        for _, row in day_shifts.iterrows():
-            name = get_staff_name(str(row["staff_id"]))
-            start = row["start_time"] or ""
-            end = row["end_time"] or ""
+        for sid, start, end in zip(
+            day_shifts["staff_id"],
+            day_shifts["start_time"].fillna(""),
+            day_shifts["end_time"].fillna(""),
+        ):
+            name = _STAFF_NAME_MAP.get(sid) or f"{sid}（削除済み）"
             time_part = f" {start}〜{end}" if start or end else ""
             shift_summaries.append(f"{name}{time_part}")
 
@@ -692,32 +962,40 @@ def page_shift_calendar(current_staff):
 
 # 一覧表示のデータフレームを表示する際、一意のキーを持たせる
     st.subheader("一覧表示")
-    st.dataframe(pd.DataFrame(rows), use_container_width=True, key=f"df_list_{year}_{month}")
+    show_paged_dataframe(
+        pd.DataFrame(rows),
+        page_size=31,
+        key=f"df_list_{year}_{month}",
+        use_container_width=True,
+    )
 
     # ----- 月間カレンダー（マス表示） -----
-    st.markdown("---")
-    st.subheader("カレンダー表示（名前＋出勤退勤予定時間）")
-
     # 各日ごとの「名前＋時間」のリストを作成（HTMLで色分け）
     day_contents: dict[dt.date, list[str]] = {}
 
     # ログイン中スタッフID
     current_staff_id = str(current_staff["staff_id"])
 
-    for _, row in month_shifts.iterrows():
-        date_obj = dt.datetime.strptime(row["date"], "%Y-%m-%d").date()
-
-        sid = str(row["staff_id"])
-        name = get_staff_name(sid)
+    # 名前・区分・ポジションは先にまとめて結合しておく（下の集計でも使い回す）
+    joined = month_shifts.merge(
+        STAFF_DF[["staff_id", "name", "role", "position"]],
+        on="staff_id",
+        how="left",
+    )
 
-        # ポジション取得（なければ空文字）
-        staff_row = STAFF_DF[STAFF_DF["staff_id"] == row["staff_id"]]
-        position = ""
-        if not staff_row.empty:
-            position = str(staff_row.iloc[0].get("position") or "")
+    # 日付は読み込み時にパース済みの _date 列を使う（文字列を1行ずつパースし直さない）
+    for date_obj, sid, name, position, start, end in zip(
+        joined["_date"].dt.date.to_numpy(),
+        joined["staff_id"].to_numpy(),
+        joined["name"].to_numpy(),
+        joined["position"].fillna("").astype(str).to_numpy(),
+        joined["start_time"].fillna("").to_numpy(),
+        joined["end_time"].fillna("").to_numpy(),
+    ):
+        # マスタに無いスタッフは「削除済み」表示
+        if pd.isna(name):
+            name = f"{sid}（削除済み）"
 
-        start = row["start_time"] or ""
-        end = row["end_time"] or ""
         time_part = f" {start}〜{end}" if start or end else ""
 
         # --- CSSクラス決定 ---
@@ -747,8 +1025,10 @@ def page_shift_calendar(current_staff):
     requests_info: dict[dt.date, dict] = {}
 
     for _, row in month_requests.iterrows():
-        date_obj = dt.datetime.strptime(row["date"], "%Y-%m-%d").date()
-        staff_row = get_staff_name(str(row["staff_id"]))
+        try:
+            date_obj = parse_date_str(str(row["date"]))
+        except ValueError:
+            continue
         name = get_staff_name(str(row["staff_id"]))
         rtype = row["request_type"]  # '希望' or 'NG'
 
@@ -760,7 +1040,7 @@ def page_shift_calendar(current_staff):
         elif rtype == "NG":
             requests_info[date_obj]["NG"].append(name)
 
-    html = build_month_calendar_html(
+    cal_html = build_month_calendar_html(
         year,
         month,
         day_contents,
@@ -768,7 +1048,8 @@ def page_shift_calendar(current_staff):
         holiday_info,
         requests_info,
     )
-    st.markdown(html, unsafe_allow_html=True)
+    # 区切り線・見出しと、不足ラベル入りのカレンダーを1回で送る
+    render_calendar_section("カレンダー表示（名前＋出勤退勤予定時間）", cal_html)
 
     # =======================================
     # 今月のスタッフ別シフト集計
@@ -780,41 +1061,15 @@ def page_shift_calendar(current_staff):
     if month_shifts.empty:
         st.info("この月にはまだシフトが登録されていません。")
     else:
-        # スタッフ名・区分を付与
-        ms = month_shifts.merge(STAFF_DF, on="staff_id", how="left")
-
-        # 文字列の時刻を「分」に変換するヘルパー
-        def _time_str_to_minutes(s: str) -> int:
-            if not s or pd.isna(s):
-                return None
-            s = str(s).strip()
-            # 24:00 対応
-            if s in ("24:00", "24"):
-                return 24 * 60
-            try:
-                hh, mm = s.split(":")
-                return int(hh) * 60 + int(mm)
-            except Exception:
-                return None
-
-        def _calc_hours(row) -> float:
-            start = row.get("start_time") or DEFAULT_OPEN_TIME
-            end = row.get("end_time") or DEFAULT_CLOSE_TIME
-
-            sm = _time_str_to_minutes(start)
-            em = _time_str_to_minutes(end)
-
-            if sm is None or em is None:
-                return 0.0
+        # スタッフ名・区分はカレンダー用に結合済みのものを使う
+        ms = joined
 
-            # 日付またぎ対応（例: 17:00〜24:00, 20:00〜02:00 など）
-            if em <= sm:
-                em += 24 * 60
-
-            diff_min = em - sm
-            return diff_min / 60.0
-
-        ms["work_hours"] = ms.apply(_calc_hours, axis=1)
+        # 勤務時間を列単位で計算（空文字は営業時間で補完、欠損・不正な時刻は 0 時間）
+        sm = _parse_minutes(ms["start_time"].replace("", DEFAULT_OPEN_TIME))
+        em = _parse_minutes(ms["end_time"].replace("", DEFAULT_CLOSE_TIME))
+        # 日付またぎ対応（例: 17:00〜24:00, 20:00〜02:00 など）
+        em = np.where(em <= sm, em + 24 * 60, em)
+        ms["work_hours"] = np.where(np.isnan(sm) | np.isnan(em), 0.0, (em - sm) / 60.0)
 
         # スタッフ別集計
         summary = (
@@ -867,16 +1122,16 @@ def page_shift_calendar(current_staff):
             "出勤回数": int(summary["出勤回数"].sum()),
             "勤務時間合計_時間": float(summary["勤務時間合計_時間"].sum()),
         }
-        summary_with_total = pd.concat(
-            [summary, pd.DataFrame([total_row])],
-            ignore_index=True,
-        )
+        summary_with_total = summary.copy()
+        summary_with_total.loc[len(summary_with_total)] = total_row
 
         # 小数1桁くらいに丸める（見やすさ用）
         summary_with_total["勤務時間合計_時間"] = summary_with_total["勤務時間合計_時間"].round(1)
 
-        st.dataframe(
+        show_paged_dataframe(
             summary_with_total,
+            page_size=20,
+            key=f"df_summary_{year}_{month}",
             use_container_width=True,
             height=400,
         )
@@ -924,8 +1179,10 @@ def page_shift_calendar(current_staff):
             "end_time": end_time_str,
             "source": "manual",
         }
-        shifts_df = pd.concat([shifts_df, pd.DataFrame([new_row])], ignore_index=True)
+        # 1行追加だけなので DataFrame を作り直さずにその場で追記（足りない列は NaN）
+        shifts_df.loc[len(shifts_df)] = new_row
         save_csv(shifts_df, SHIFT_FILE)
+        _remember_saved_shifts(shifts_df)
         st.success("シフトを追加しました。")
         st.rerun()
 
@@ -958,23 +1215,28 @@ def page_shift_calendar(current_staff):
         st.info("この日には編集できるシフトがありません。")
     else:
         # シフト選択プルダウン（内部的には DataFrame の index を使う）
-        options = editable_shifts.index.tolist()
-
-        def format_shift_option(idx: int) -> str:
-            row = editable_shifts.loc[idx]
-            name = get_staff_name(str(row["staff_id"]))
-            return f"{name} {row['date']} {row['start_time']}〜{row['end_time']}"
+        # 表示ラベルは先にまとめて作っておき、format_func では辞書を引くだけにする
+        label_map = {
+            idx: f"{get_staff_name(str(sid))} {date_s} {start}〜{end}"
+            for idx, sid, date_s, start, end in zip(
+                editable_shifts.index,
+                editable_shifts["staff_id"],
+                editable_shifts["date"],
+                editable_shifts["start_time"],
+                editable_shifts["end_time"],
+            )
+        }
 
         selected_idx = st.selectbox(
             "編集するシフトを選択",
-            options,
-            format_func=format_shift_option,
+            list(label_map.keys()),
+            format_func=label_map.__getitem__,
             key="edit_shift_select",
         )
 
         # 選択されたシフトの現在値を取得
         selected_row = editable_shifts.loc[selected_idx]
-        current_date_obj = dt.datetime.strptime(selected_row["date"], "%Y-%m-%d").date()
+        current_date_obj = parse_date_str(str(selected_row["date"]))
 
         # 日付変更時の最小日付（非社員は edit_lock_until 以降のみ）
         min_editable_date = today - dt.timedelta(days=365)
@@ -1009,6 +1271,7 @@ def page_shift_calendar(current_staff):
                 shifts_df.loc[selected_idx, "start_time"] = new_start
                 shifts_df.loc[selected_idx, "end_time"] = new_end
                 save_csv(shifts_df, SHIFT_FILE)
+                _remember_saved_shifts(shifts_df)
                 st.success("シフトを更新しました。")
                 st.rerun()
 
@@ -1016,6 +1279,7 @@ def page_shift_calendar(current_staff):
             if st.button("このシフトを削除"):
                 shifts_df = shifts_df.drop(index=selected_idx)
                 save_csv(shifts_df, SHIFT_FILE)
+                _remember_saved_shifts(shifts_df)
                 st.success("シフトを削除しました。")
                 st.rerun()
 
@@ -1032,12 +1296,11 @@ def page_shift_calendar(current_staff):
         )
 
         if st.button("🚨 この月のシフトを全て削除する（取り消し不可）", key="reset_month_bottom"):
-            month_prefix_for_reset = f"{year:04d}-{month:02d}-"
-
             # この月のシフトだけ除外して残す
-            remaining = shifts_df[~shifts_df["date"].str.startswith(month_prefix_for_reset)]
+            remaining = shifts_df[~month_mask]
 
             save_csv(remaining, SHIFT_FILE)
+            _remember_saved_shifts(remaining)
 
             st.success(f"{year}年{month}月のシフトを全て削除しました。（希望/NGは残しています）")
             st.rerun()
@@ -1053,6 +1316,8 @@ def page_shift_request(current_staff):
         REQUEST_FILE,
         ["request_id", "date", "staff_id", "request_type", "start_time", "end_time", "note"],
     )
+    # request_id が空の古い行があれば、ensure_request_ids が振った ID を CSV にも残す必要がある
+    ids_filled = bool(pd.to_numeric(requests_df["request_id"], errors="coerce").isna().any())
     requests_df = ensure_request_ids(requests_df)
 
     today = dt.date.today()
@@ -1112,11 +1377,14 @@ def page_shift_request(current_staff):
             "end_time": end_time_str,
             "note": note,
         }
-        requests_df = pd.concat(
-            [requests_df, pd.DataFrame([new_row])],
-            ignore_index=True,
-        )
-        save_csv(requests_df, REQUEST_FILE)
+        if ids_filled:
+            # 古い行に振った ID ごと全体を書き直す（追記だけだと読み込むたびに ID が変わる）
+            requests_df.loc[len(requests_df)] = new_row
+            save_csv(requests_df, REQUEST_FILE)
+        else:
+            append_row_csv(requests_df, REQUEST_FILE, new_row, FILE_SCHEMA["shift_requests"])
+            # 下の一覧にもすぐ出るように、表示用の DataFrame にも足しておく
+            requests_df.loc[len(requests_df)] = new_row
         st.success("登録しました。")
 
     # ---------------- 一覧 & 取り消し ----------------
@@ -1162,6 +1430,65 @@ def page_shift_request(current_staff):
         st.rerun()
 
 
+# 自動シフト用にスタッフマスタから作る情報
+_StaffIndex = namedtuple(
+    "_StaffIndex",
+    ["employees", "parttimers", "position_map", "employee_dayoff_map", "max_shifts_per_person"],
+)
+
+
+def _staff_index() -> _StaffIndex:
+    """STAFF_DF から自動シフト用の一覧・辞書をまとめて作る"""
+    sids = STAFF_DF["staff_id"].astype(str)
+    is_emp = STAFF_DF["role"] == "社員"
+
+    # ---- 社員 / アルバイトリスト ----
+    employees = sids[is_emp].tolist()
+    parttimers = sids[STAFF_DF["role"] == "アルバイト"].tolist()
+
+    # ---- ポジション情報 ----
+    position_map = dict(zip(sids, STAFF_DF["position"].fillna("").astype(str)))
+
+    # ---- 社員の固定休 {staff_id -> {曜日indexセット}} ----
+    employee_dayoff_map: dict[str, set[int]] = {sid: set() for sid in employees}
+    for col in ["dayoff1", "dayoff2"]:
+        if col not in STAFF_DF.columns:
+            continue
+        # Int8（欠損あり）のままだと NA との比較が例外になるので float にそろえる
+        values = pd.to_numeric(STAFF_DF.loc[is_emp, col], errors="coerce").astype(float)
+        for sid, w in zip(sids[is_emp], values):
+            if 0 <= w <= 6:  # NaN はここで落ちる
+                employee_dayoff_map[sid].add(int(w))
+
+    # ---- 月あたり最大シフト回数 ----
+    if "desired_shifts_per_month" in STAFF_DF.columns:
+        # 新方式：月上限をそのまま使う（例: 23 回）
+        caps = pd.to_numeric(STAFF_DF["desired_shifts_per_month"], errors="coerce").fillna(0).astype(int)
+    elif "desired_shifts_per_week" in STAFF_DF.columns:
+        # 旧方式との後方互換：週希望回数 × 4 を月上限とみなす
+        caps = pd.to_numeric(STAFF_DF["desired_shifts_per_week"], errors="coerce").fillna(0).astype(int) * 4
+    else:
+        # どちらの列も無い場合のデフォルト（とりあえず 12 回 / 月）
+        caps = pd.Series(12, index=STAFF_DF.index)
+    max_shifts_per_person = dict(zip(sids, caps.tolist()))
+
+    return _StaffIndex(employees, parttimers, position_map, employee_dayoff_map, max_shifts_per_person)
+
+
+# 自動シフト案の列（new_shift_rows のタプルはこの順で持つ）
+AUTO_SHIFT_COLUMNS = ["date", "staff_id", "start_time", "end_time", "source"]
+
+
+def _kitchen_pick_key(c: dict) -> tuple:
+    """キッチン枠の候補順：希望日 → キッチン優先度 → 回数少ない → ID"""
+    return (not c["is_hope"], c["kitchen_rank"], c["assigned_count"], c["staff_id"])
+
+
+def _hall_or_any_pick_key(c: dict) -> tuple:
+    """ホール枠 / 通常枠の候補順：希望日 → バイト優先 → 回数少ない → ID"""
+    return (not c["is_hope"], c["is_employee"], c["assigned_count"], c["staff_id"])
+
+
 # =========================
 # 自動シフト提案（既存シフトを尊重して「不足分だけ」埋める版）
 # 仕様：
@@ -1179,215 +1506,157 @@ def auto_assign_shifts_for_month(
 ):
     dates = date_range_for_month(year, month)
 
-    # ---- 希望 / NG を日付ごとにまとめる ----
-    req_by_date: dict[str, dict] = {}
-    for _, r in requests_df.iterrows():
-        d = str(r["date"])
-        if d not in req_by_date:
-            req_by_date[d] = {"希望": set(), "NG": set()}
-        if r["request_type"] == "希望":
-            req_by_date[d]["希望"].add(str(r["staff_id"]))
-        elif r["request_type"] == "NG":
-            req_by_date[d]["NG"].add(str(r["staff_id"]))
-
-    # ---- 社員 / アルバイトリスト ----
-    employees = [str(s) for s in STAFF_DF[STAFF_DF["role"] == "社員"]["staff_id"].tolist()]
-    parttimers = [str(s) for s in STAFF_DF[STAFF_DF["role"] == "アルバイト"]["staff_id"].tolist()]
+    # ---- 日付ごとの情報（文字列・曜日・週末・祝日）は最初に一度だけ作る ----
+    holidays = dict(jpholiday.month_holidays(year, month))
+    day_meta = [
+        {
+            "date": d,
+            "str": d.strftime("%Y-%m-%d"),
+            "weekday": d.weekday(),
+            "weekend": is_weekend(d),
+            "holiday": holidays.get(d),
+        }
+        for d in dates
+    ]
 
-    # ---- ポジション情報 ----
-    position_map = {
-        str(row["staff_id"]): str(row.get("position") or "")
-        for _, row in STAFF_DF.iterrows()
+    # ---- 希望 / NG を日付ごとにまとめる ----
+    grp = (
+        requests_df.astype({"date": str, "staff_id": str})
+        .groupby(["date", "request_type"], observed=True)["staff_id"]
+        .agg(set)
+    )
+    req_by_date: dict[str, dict] = {
+        d: {"希望": grp.get((d, "希望"), set()), "NG": grp.get((d, "NG"), set())}
+        for d in grp.index.get_level_values("date").unique()
     }
 
+    # ---- スタッフマスタ由来の情報（社員/バイト・ポジション・固定休・月上限） ----
+    staff_idx = _staff_index()
+    employees = staff_idx.employees
+    parttimers = staff_idx.parttimers
+    position_map = staff_idx.position_map
+    employee_dayoff_map = staff_idx.employee_dayoff_map
+    max_shifts_per_person = staff_idx.max_shifts_per_person
+    employees_set = set(employees)
+
     MANAGER_ID = "S001"  # 宮首さん
     CHEF_ID = "S002"     # 山田(料理長)
     EMP_SATO_ID = "S003" # 佐藤(社員)
 
-    def is_kitchen_capable_for_day(sid: str, sato_is_off: bool) -> bool:
-        """そのスタッフが『この日』キッチン要員として数えて良いか"""
-        # 佐藤はキッチンには入れない
-        if sid == EMP_SATO_ID:
-            return False
-
-        # 佐藤が休みの日は店長をキッチンカウントから外す
-        if sato_is_off and sid == MANAGER_ID:
-            return False
-
-        pos = position_map.get(sid, "")
-        if pos in ("料理長", "調理場担当", "オールラウンド"):
-            return True
-        if sid == MANAGER_ID:
-            # 店長は基本的にはキッチンも可能
-            return True
-        return False
-
-    def kitchen_priority_rank(sid: str) -> int:
-        """キッチン要員の優先度（数字が小さいほど優先）"""
-        pos = position_map.get(sid, "")
-        if sid == CHEF_ID:              # 料理長
-            return 0
-        if pos == "調理場担当":          # バイト調理
-            return 1
-        if pos == "オールラウンド":      # バイトオールラウンド
-            return 2
-        if sid == MANAGER_ID:           # 店長
-            return 3
-        return 9                         # それ以外は低優先
-
-    def counts_for_hall(sid: str) -> bool:
-        """ホール人数としてカウントして良いか"""
-        pos = position_map.get(sid, "")
-        # 調理場専任バイトはホール人数には含めない
-        if pos == "調理場担当":
-            return False
-        return True
-
-    # ---- 社員の固定休 {staff_id -> {曜日indexセット}} ----
-    employee_dayoff_map: dict[str, set[int]] = {}
-    for _, row in STAFF_DF.iterrows():
-        sid = str(row["staff_id"])
-        if row["role"] != "社員":
-            continue
-        offs = set()
-        for col in ["dayoff1", "dayoff2"]:
-            if col in row and not pd.isna(row[col]):
-                try:
-                    w = int(row[col])
-                    if 0 <= w <= 6:
-                        offs.add(w)
-                except Exception:
-                    pass
-        employee_dayoff_map[sid] = offs
-
-    def _to_int_safe(x, default=0):
-        """NaN や空文字でも落ちない int 変換ヘルパー"""
-        try:
-            if pd.isna(x):
-                return default
-            return int(x)
-        except Exception:
-            return default
-
-    # ---- 月あたり最大シフト回数 ----
-    if "desired_shifts_per_month" in STAFF_DF.columns:
-        # 新方式：月上限をそのまま使う（例: 23 回）
-        max_shifts_per_person = {
-            str(row["staff_id"]): _to_int_safe(row["desired_shifts_per_month"], 0)
-            for _, row in STAFF_DF.iterrows()
-        }
-    elif "desired_shifts_per_week" in STAFF_DF.columns:
-        # 旧方式との後方互換：週希望回数 × 4 を月上限とみなす
-        max_shifts_per_person = {
-            str(row["staff_id"]): _to_int_safe(row["desired_shifts_per_week"], 0) * 4
-            for _, row in STAFF_DF.iterrows()
-        }
-    else:
-        # どちらの列も無い場合のデフォルト（とりあえず 12 回 / 月）
-        max_shifts_per_person = {
-            str(row["staff_id"]): 12
-            for _, row in STAFF_DF.iterrows()
-        }
+    # ---- キッチン / ホール判定は staff_id ごとに先に作っておく ----
+    # キッチン要員として数えて良いか
+    #   - 佐藤はキッチンには入れない
+    #   - 店長は基本的にはキッチンも可能
+    kitchen_capable_base = {
+        sid: sid != EMP_SATO_ID and (pos in ("料理長", "調理場担当", "オールラウンド") or sid == MANAGER_ID)
+        for sid, pos in position_map.items()
+    }
+    # 佐藤が休みの日は店長をキッチンカウントから外す
+    kitchen_capable_sato_off = {
+        sid: capable and sid != MANAGER_ID
+        for sid, capable in kitchen_capable_base.items()
+    }
+    # ホール人数としてカウントして良いか（調理場専任バイトはホール人数には含めない）
+    hall_capable = {sid: pos != "調理場担当" for sid, pos in position_map.items()}
+
+    # キッチン要員の優先度（数字が小さいほど優先）
+    #   料理長 → バイト調理 → バイトオールラウンド → 店長 → それ以外
+    kitchen_rank = {
+        sid: (
+            0 if sid == CHEF_ID
+            else 1 if pos == "調理場担当"
+            else 2 if pos == "オールラウンド"
+            else 3 if sid == MANAGER_ID
+            else 9
+        )
+        for sid, pos in position_map.items()
+    }
 
     # ---- 既存シフトぶんを人数カウントに反映 ----
-    assigned_count = {sid: 0 for sid in max_shifts_per_person.keys()}
-    for _, row in existing_shifts_df.iterrows():
-        sid = str(row["staff_id"])
-        if sid in assigned_count:
-            assigned_count[sid] += 1
-
-    # ---- ヘルパー：ある日の社員候補を作る ----
-    def make_employee_candidates(
+    existing_counts = existing_shifts_df["staff_id"].value_counts().to_dict()
+    assigned_count = {sid: existing_counts.get(sid, 0) for sid in max_shifts_per_person}
+
+    # ---- ヘルパー：ある日に入れる社員を1人選ぶ ----
+    def pick_employee_candidate(
         d: dt.date,
-        assigned_today: list[str],
+        assigned_today: set[str],
         hope_set: set[str],
         ng_set: set[str],
-    ) -> list[dict]:
+    ) -> dict | None:
         weekday_idx = d.weekday()
-        cand = []
-        for sid in employees:
-            # NG
-            if sid in ng_set:
-                continue
-            # 当日すでに入っている
-            if sid in assigned_today:
-                continue
-            # 月上限チェック
-            max_cap = max_shifts_per_person.get(sid, 0)
-            used = assigned_count.get(sid, 0)
-            remaining = max_cap - used
-            if remaining <= 0:
-                continue
-            # 固定休
-            offs = employee_dayoff_map.get(sid, set())
-            if weekday_idx in offs:
-                continue
-
-            cand.append(
-                {
-                    "staff_id": sid,
-                    "is_hope": sid in hope_set,   # 希望日
-                    "assigned_count": used,       # すでに何回入ってるか
-                    "remaining_cap": remaining,   # あと何回入れるか（均等化の核）
-                }
-            )
+        cand = (
+            {
+                "staff_id": sid,
+                "is_hope": sid in hope_set,   # 希望日
+                "assigned_count": assigned_count.get(sid, 0),   # すでに何回入ってるか
+                # あと何回入れるか（均等化の核）
+                "remaining_cap": max_shifts_per_person.get(sid, 0) - assigned_count.get(sid, 0),
+            }
+            for sid in employees
+            if sid not in ng_set                                        # NG
+            and sid not in assigned_today                               # 当日すでに入っている
+            and weekday_idx not in employee_dayoff_map.get(sid, set())  # 固定休
+        )
 
-        # --- 均等化ソート ---
-        cand.sort(
+        # --- 均等化：並べ替えずに先頭に来る1人だけを選ぶ ---
+        return min(
+            (c for c in cand if c["remaining_cap"] > 0),   # 月上限チェック
             key=lambda c: (
                 not c["is_hope"],      # 希望者を最優先
                 -c["remaining_cap"],   # 残り枠の多い人を優先（均等化）
                 c["assigned_count"],   # 現在の担当回数が少ない人
                 c["staff_id"],         # タイブレーク
-            )
+            ),
+            default=None,
         )
-        return cand
 
     # ---- ヘルパー：ある日を「社員 target_emp 人」に近づける ----
-    new_shift_rows: list[dict] = []
+    new_shift_rows: list[tuple] = []  # AUTO_SHIFT_COLUMNS の順
+
+    # 日付 → その日に入っているスタッフ（既存＋自動案）/ 社員数
+    # 自動案を追加するたびに両方を更新するので、日毎に全件スキャンしなくて済む
+    staff_by_date: dict[str, list[str]] = (
+        existing_shifts_df["staff_id"].groupby(existing_shifts_df["date"]).apply(list).to_dict()
+    )
+    emp_count_by_date: dict[str, int] = {
+        day_str: sum(1 for sid in sids if sid in employees_set)
+        for day_str, sids in staff_by_date.items()
+    }
 
     def assign_employees_for_day(d: dt.date, target_emp: int):
         nonlocal new_shift_rows
 
         day_str = d.strftime("%Y-%m-%d")
-        # その日の既存シフト（社員 / バイト混在）
-        existing_today = existing_shifts_df[existing_shifts_df["date"] == day_str]
-        assigned_today = existing_today["staff_id"].astype(str).tolist()
-
-        # すでに追加した自動案も考慮
-        for r in new_shift_rows:
-            if r["date"] == day_str:
-                assigned_today.append(str(r["staff_id"]))
-
-        # その日に既に入っている社員数
-        current_emp = sum(1 for sid in assigned_today if sid in employees)
+        # その日に既に入っている社員数（足りていれば何も作らずに戻る）
+        current_emp = emp_count_by_date.get(day_str, 0)
         need = max(target_emp - current_emp, 0)
         if need <= 0:
             return  # もう十分入っている
 
+        # その日に入っているスタッフ（社員 / バイト混在、自動案も含む）
+        assigned_today = staff_by_date.setdefault(day_str, [])
+
         day_info = req_by_date.get(day_str, {"希望": set(), "NG": set()})
         hope_set = day_info["希望"]
         ng_set = day_info["NG"]
 
+        # 候補の絞り込みでは集合で所属判定する（人数カウント用にリストも残す）
+        assigned_today_set = set(assigned_today)
+
         for _ in range(need):
-            cand = make_employee_candidates(d, assigned_today, hope_set, ng_set)
-            if not cand:
+            chosen = pick_employee_candidate(d, assigned_today_set, hope_set, ng_set)
+            if chosen is None:
                 break  # 入れられる社員がもういない
 
-            chosen = cand[0]
             sid = chosen["staff_id"]
 
             assigned_today.append(sid)
+            assigned_today_set.add(sid)
             assigned_count[sid] = assigned_count.get(sid, 0) + 1
+            emp_count_by_date[day_str] = emp_count_by_date.get(day_str, 0) + 1
 
             new_shift_rows.append(
-                {
-                    "date": day_str,
-                    "staff_id": sid,
-                    "start_time": DEFAULT_OPEN_TIME,
-                    "end_time": DEFAULT_CLOSE_TIME,
-                    "source": "auto",
-                }
+                (day_str, sid, DEFAULT_OPEN_TIME, DEFAULT_CLOSE_TIME, "auto")
             )
 
     # =========================
@@ -1399,51 +1668,36 @@ def auto_assign_shifts_for_month(
     # =========================
     # Phase 2: 金→土→日→祝（平日）に社員3人目を入れる
     # =========================
-    fridays = [d for d in dates if d.weekday() == 4]
-    saturdays = [d for d in dates if d.weekday() == 5]
-    sundays = [d for d in dates if d.weekday() == 6]
-    # 祝日は、平日（月〜木）の祝日のみ対象にして重複を避ける
-    holiday_weekdays = [
-        d
-        for d in dates
-        if get_jp_holiday_name(d) and d.weekday() <= 3
-    ]
-
-    for d in fridays + saturdays + sundays + holiday_weekdays:
-        assign_employees_for_day(d, target_emp=3)
+    # 曜日ごとの入れ物に1回の走査で振り分ける（4=金, 5=土, 6=日, "hol"=平日の祝日）
+    buckets: dict = {4: [], 5: [], 6: [], "hol": []}
+    for m in day_meta:
+        wd = m["weekday"]
+        if wd in buckets:
+            buckets[wd].append(m["date"])
+        elif m["holiday"]:
+            # 祝日は、平日（月〜木）の祝日のみ対象にして重複を避ける
+            buckets["hol"].append(m["date"])
+
+    for key in (4, 5, 6, "hol"):
+        for d in buckets[key]:
+            assign_employees_for_day(d, target_emp=3)
 
     # =========================
     # Phase 3: 残りの「人数不足分」を社員＋アルバイトで埋める
     # =========================
     # ここからは、既存シフト + new_shift_rows を起点に、
     # 平日5人 / 週末6人 を満たすように不足分だけ追加する。
-    combined = pd.concat(
-        [
-            existing_shifts_df,
-            pd.DataFrame(new_shift_rows),
-        ],
-        ignore_index=True,
-    )
+    # （どちらも staff_by_date に反映済みなので、DataFrame を結合し直す必要はない）
 
-    # パート含めた上限カウントを更新
-    # （社員分はすでに増えているのでそのまま、バイト分も足しておく）
-    for _, row in combined.iterrows():
-        sid = str(row["staff_id"])
-        if sid in assigned_count:
-            # 既に社員分は加算済みだが、二重にはならないように注意。
-            # ここでは「existing_shifts_df」ぶんだけ追加したいが、
-            # new_shift_rows はすでに上で加算しているのでスキップしてもよい。
-            pass
-
-    # バイトも含めた候補生成
-    def make_any_candidates(
+    # バイトも含めた候補から1人選ぶ
+    def pick_any_candidate(
         d: dt.date,
-        assigned_today: list[str],
+        assigned_today: set[str],
         hope_set: set[str],
         ng_set: set[str],
         mode: str,
         sato_is_off: bool,
-    ) -> list[dict]:
+    ) -> dict | None:
         """
         mode:
           - 'kitchen': キッチン不足分を優先して埋める
@@ -1451,89 +1705,56 @@ def auto_assign_shifts_for_month(
           - 'any'    : 通常（これまで通り）
         """
         weekday_idx = d.weekday()
-        cand = []
-        for sid in employees + parttimers:
-            # NG
-            if sid in ng_set:
-                continue
-            # すでに当日入っている
-            if sid in assigned_today:
-                continue
-            # 月上限
-            if assigned_count.get(sid, 0) >= max_shifts_per_person.get(sid, 0):
-                continue
-            # 固定休（社員のみ）
-            if sid in employees:
-                offs = employee_dayoff_map.get(sid, set())
-                if weekday_idx in offs:
-                    continue
-
-            pos = position_map.get(sid, "")
+        kitchen_capable = kitchen_capable_sato_off if sato_is_off else kitchen_capable_base
 
-            # --- mode別フィルタ ---
-            if mode == "kitchen":
-                if not is_kitchen_capable_for_day(sid, sato_is_off):
+        def candidates():
+            for sid in employees + parttimers:
+                # NG
+                if sid in ng_set:
                     continue
-            elif mode == "hall":
-                if not counts_for_hall(sid):
+                # すでに当日入っている
+                if sid in assigned_today:
                     continue
-            else:
-                pass  # any の時は特に制限なし
+                # 月上限
+                if assigned_count.get(sid, 0) >= max_shifts_per_person.get(sid, 0):
+                    continue
+                # 固定休（社員のみ）
+                if sid in employees_set:
+                    offs = employee_dayoff_map.get(sid, set())
+                    if weekday_idx in offs:
+                        continue
+
+                # --- mode別フィルタ ---
+                if mode == "kitchen":
+                    if not kitchen_capable.get(sid, False):
+                        continue
+                elif mode == "hall":
+                    if not hall_capable.get(sid, True):
+                        continue
+                else:
+                    pass  # any の時は特に制限なし
 
-            cand.append(
-                {
+                yield {
                     "staff_id": sid,
-                    "is_employee": sid in employees,
+                    "is_employee": sid in employees_set,
                     "is_hope": sid in hope_set,
                     "assigned_count": assigned_count.get(sid, 0),
-                    "pos": pos,
+                    "kitchen_rank": kitchen_rank.get(sid, 9),
                 }
-            )
-
-        # --- ソート ---
-        if mode == "kitchen":
-            # 希望日 → キッチン優先度 → 回数少ない → ID
-            cand.sort(
-                key=lambda c: (
-                    not c["is_hope"],
-                    kitchen_priority_rank(c["staff_id"]),
-                    c["assigned_count"],
-                    c["staff_id"],
-                )
-            )
-        elif mode == "hall":
-            # 希望日 → バイト優先 → 回数少ない → ID
-            cand.sort(
-                key=lambda c: (
-                    not c["is_hope"],
-                    c["is_employee"],      # ★ ここを変更（バイト優先）
-                    c["assigned_count"],
-                    c["staff_id"],
-                )
-            )
-        else:  # any
-            # 希望日 → バイト優先 → 回数少ない → ID
-            cand.sort(
-                key=lambda c: (
-                    not c["is_hope"],
-                    c["is_employee"],      # ★ ここも同じく変更
-                    c["assigned_count"],
-                    c["staff_id"],
-                )
-            )
 
-
-        return cand
+        # --- 並べ替えずに先頭に来る1人だけを選ぶ（hall / any は同じ並び順） ---
+        keyfn = _kitchen_pick_key if mode == "kitchen" else _hall_or_any_pick_key
+        return min(candidates(), key=keyfn, default=None)
 
     # 日毎に不足分だけ埋める
-    for d in dates:
-        day_str = d.strftime("%Y-%m-%d")
-        weekend_flag = is_weekend(d)
+    for m in day_meta:
+        d = m["date"]
+        day_str = m["str"]
+        weekend_flag = m["weekend"]
         required_staff = WEEKEND_REQUIRED_STAFF if weekend_flag else WEEKDAY_REQUIRED_STAFF
 
-        day_shifts = combined[combined["date"] == day_str]
-        # combined の中に new_shift_rows も既に含まれているので、これだけでOK
-        assigned_today = day_shifts["staff_id"].astype(str).tolist()
+        # staff_by_date には new_shift_rows ぶんも既に含まれているので、これだけでOK
+        assigned_today = staff_by_date.setdefault(day_str, [])
 
         current_count = len(assigned_today)
         remaining = max(required_staff - current_count, 0)
@@ -1544,20 +1765,23 @@ def auto_assign_shifts_for_month(
         hope_set = day_info["希望"]
         ng_set = day_info["NG"]
 
+        # 候補の絞り込みでは集合で所属判定する（人数カウント用にリストも残す）
+        assigned_today_set = set(assigned_today)
+
         # 佐藤がその日に入っているか
-        sato_is_off = (EMP_SATO_ID not in assigned_today)
+        sato_is_off = (EMP_SATO_ID not in assigned_today_set)
 
         for _ in range(remaining):
             # その時点でのキッチン / ホール人数を計算
             kitchen_count = sum(
                 1
                 for sid in assigned_today
-                if is_kitchen_capable_for_day(sid, sato_is_off=False)  # 宮首も含めた純粋なキッチン能力
+                if kitchen_capable_base.get(sid, False)  # 宮首も含めた純粋なキッチン能力
             )
             hall_count = sum(
                 1
                 for sid in assigned_today
-                if counts_for_hall(sid)
+                if hall_capable.get(sid, True)
             )
 
             need_kitchen = max(2 - kitchen_count, 0)
@@ -1570,26 +1794,35 @@ def auto_assign_shifts_for_month(
             else:
                 mode = "any"
 
-            cand = make_any_candidates(d, assigned_today, hope_set, ng_set, mode, sato_is_off)
-            if not cand:
+            chosen = pick_any_candidate(d, assigned_today_set, hope_set, ng_set, mode, sato_is_off)
+            if chosen is None:
                 break  # 本当に誰も入れない
 
-            chosen = cand[0]
             sid = chosen["staff_id"]
             assigned_today.append(sid)
+            assigned_today_set.add(sid)
             assigned_count[sid] = assigned_count.get(sid, 0) + 1
             new_shift_rows.append(
-                {
-                    "date": day_str,
-                    "staff_id": sid,
-                    "start_time": DEFAULT_OPEN_TIME,
-                    "end_time": DEFAULT_CLOSE_TIME,
-                    "source": "auto",
-                }
+                (day_str, sid, DEFAULT_OPEN_TIME, DEFAULT_CLOSE_TIME, "auto")
             )
 
     # 最終的に「新しく追加されたぶんだけ」を返す
-    return pd.DataFrame(new_shift_rows)
+    return pd.DataFrame(new_shift_rows, columns=AUTO_SHIFT_COLUMNS)
+
+
+@st.cache_data(show_spinner=False)
+def _auto_assign_cached(
+    year: int,
+    month: int,
+    requests_df: pd.DataFrame,
+    existing_shifts_df: pd.DataFrame,
+    staff_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    auto_assign_shifts_for_month の結果をキャッシュする。
+    staff_df は中では使わないが、スタッフマスタが変わったら作り直すためにキーに含める。
+    """
+    return auto_assign_shifts_for_month(year, month, requests_df, existing_shifts_df)
 
 
 def page_auto_scheduler(current_staff):
@@ -1630,13 +1863,13 @@ def page_auto_scheduler(current_staff):
         ["date", "staff_id", "start_time", "end_time", "source"],
     )
 
-    # 在籍スタッフID（文字列に揃える）
-    active_ids = [str(sid) for sid in get_active_staff_ids()]
+    # 在籍スタッフID（frozenset のまま isin に渡す。staff_id は読み込み時に文字列化済み）
+    active_ids = get_active_staff_ids()
 
     # 対象月の既存シフト（★削除済みスタッフは除外）
     existing_month_shifts = shifts_df[
         (shifts_df["date"].str.startswith(month_str_prefix))
-        & (shifts_df["staff_id"].astype(str).isin(active_ids))
+        & (shifts_df["staff_id"].isin(active_ids))
     ]
 
     # --------- 対象月の既存シフト表示 ---------
@@ -1651,37 +1884,41 @@ def page_auto_scheduler(current_staff):
         st.dataframe(merged_exist, use_container_width=True, height=250)
 
     # --------- 不足日チェック（本当に足りているかの確認） ---------
-    shortage_days: list[str] = []
     employee_ids = (
         STAFF_DF[STAFF_DF["role"] == "社員"]["staff_id"]
         .astype(str)
         .tolist()
     )
 
-    for d in date_range_for_month(year, month):
-        day_str = d.strftime("%Y-%m-%d")
-        weekend_flag = is_weekend(d)
-        required_staff = WEEKEND_REQUIRED_STAFF if weekend_flag else WEEKDAY_REQUIRED_STAFF
-
-        day_shifts = existing_month_shifts[existing_month_shifts["date"] == day_str]
-        current_count = len(day_shifts)
+    # 日ごとの必要人数（週末かどうかで変わる）
+    month_dates = date_range_for_month(year, month)
+    required_per_day = pd.Series(
+        [WEEKEND_REQUIRED_STAFF if is_weekend(d) else WEEKDAY_REQUIRED_STAFF for d in month_dates],
+        index=[d.strftime("%Y-%m-%d") for d in month_dates],
+    )
 
-        current_emp_count = len(
-            day_shifts[day_shifts["staff_id"].astype(str).isin(employee_ids)]
-        )
+    # 日ごとの人数 / 社員数を groupby で一度に数える（シフトが無い日は 0）
+    counts = existing_month_shifts.groupby("date").size().reindex(required_per_day.index, fill_value=0)
+    emp_counts = (
+        existing_month_shifts[existing_month_shifts["staff_id"].isin(employee_ids)]
+        .groupby("date")
+        .size()
+        .reindex(required_per_day.index, fill_value=0)
+    )
 
-        if current_count < required_staff or current_emp_count < REQUIRED_EMPLOYEES:
-            shortage_days.append(day_str)
+    shortage_mask = (counts < required_per_day) | (emp_counts < REQUIRED_EMPLOYEES)
+    shortage_days: list[str] = required_per_day.index[shortage_mask.to_numpy()].tolist()
 
     # ---------------- ボタンで自動案生成 ----------------
     if st.button("この条件で【不足分だけ】自動シフト案を生成"):
         month_requests = requests_df[requests_df["date"].str.startswith(month_str_prefix)]
 
-        auto_df = auto_assign_shifts_for_month(
+        auto_df = _auto_assign_cached(
             int(year),
             int(month),
             month_requests,
             existing_month_shifts,
+            STAFF_DF,
         )
 
         st.session_state["auto_shift_proposal_v2"] = auto_df
@@ -1723,9 +1960,6 @@ def page_auto_scheduler(current_staff):
     st.caption("※ まだ保存されていません。「不足分を既存シフトに追加して保存」を押すと確定します。")
 
     # --- マス目カレンダーでプレビュー（自動案を反映した状態） ---
-    st.markdown("---")
-    st.subheader("自動シフト提案を反映したカレンダープレビュー")
-
     # 既存シフト + 自動案を合算
     combined = pd.concat(
         [
@@ -1751,46 +1985,49 @@ def page_auto_scheduler(current_staff):
 
     # 不足人数 & 祝日情報
     shortage_info: dict[dt.date, int] = {}
-    holiday_info: dict[dt.date, str] = {}
+    holiday_info: dict[dt.date, str] = dict(jpholiday.month_holidays(year, month))
 
-    active_ids = get_active_staff_ids()
+    # 🔴 削除済みスタッフは人数カウントから除外（isin は日毎ではなく全体で一度だけ）
+    active_counts = (
+        combined[combined["staff_id"].isin(active_ids)].groupby("date").size().to_dict()
+    )
 
     for d in all_dates:
         day_str = d.strftime("%Y-%m-%d")
         is_weekend_flag = is_weekend(d)
         required_staff = WEEKEND_REQUIRED_STAFF if is_weekend_flag else WEEKDAY_REQUIRED_STAFF
 
-        # 祝日名
-        hname = get_jp_holiday_name(d)
-        if hname:
-            holiday_info[d] = hname
-
-        # その日のシフト（既存＋自動案）
-        day_shifts = combined[combined["date"] == day_str]
-
-        # 🔴 削除済みスタッフは人数カウントから除外
-        active_day_shifts = day_shifts[day_shifts["staff_id"].astype(str).isin(active_ids)]
-        current_count = len(active_day_shifts)
+        # その日のシフト（既存＋自動案）のうち在籍スタッフの人数
+        current_count = active_counts.get(day_str, 0)
 
         remaining = max(required_staff - current_count, 0)
         if remaining > 0:
             shortage_info[d] = remaining
 
     # カレンダーに表示する「名前＋時間」の文字列
+    # 日付のパースと名前の付与は列単位でまとめて行う
     day_contents: dict[dt.date, list[str]] = {}
-    for _, row in combined.iterrows():
-        date_obj = dt.datetime.strptime(row["date"], "%Y-%m-%d").date()
-        name = get_staff_name(str(row["staff_id"]))  # 削除済み対応
-        start = row["start_time"] or ""
-        end = row["end_time"] or ""
-        time_part = f" {start}〜{end}" if start or end else ""
-        text = f"{name}{time_part}"
-        day_contents.setdefault(date_obj, []).append(text)
+    combined_local = combined.copy()
+    combined_local["_date_obj"] = pd.to_datetime(
+        combined_local["date"], format="%Y-%m-%d"
+    ).dt.date
+    sid_str = combined_local["staff_id"]
+    # 削除済み対応：マスタに無いIDは「ID（削除済み）」
+    combined_local["_name"] = sid_str.map(_STAFF_NAME_MAP).fillna(sid_str + "（削除済み）")
+
+    for date_obj, grp in combined_local.groupby("_date_obj", sort=False):
+        texts = []
+        for name, start, end in zip(grp["_name"], grp["start_time"], grp["end_time"]):
+            start = start or ""
+            end = end or ""
+            time_part = f" {start}〜{end}" if start or end else ""
+            texts.append(f"{name}{time_part}")
+        day_contents[date_obj] = texts
 
     # このプレビューでは希望/NGは使わない
     requests_info: dict[dt.date, dict] = {}
 
-    html = build_month_calendar_html(
+    cal_html = build_month_calendar_html(
         year,
         month,
         day_contents,
@@ -1798,7 +2035,7 @@ def page_auto_scheduler(current_staff):
         holiday_info,
         requests_info,
     )
-    st.markdown(html, unsafe_allow_html=True)
+    render_calendar_section("自動シフト提案を反映したカレンダープレビュー", cal_html)
 
     # --- 保存ボタン ---
     st.markdown("---")
@@ -1807,15 +2044,10 @@ def page_auto_scheduler(current_staff):
             st.info("追加するシフトがありません。")
             return
 
-        # 最新のシフトファイルを読み直してから結合する
-        shifts_df_latest = load_csv(
-            SHIFT_FILE,
-            ["date", "staff_id", "start_time", "end_time", "source"],
-        )
-
         # 既存 + 自動案を結合
+        # （shifts_df はボタンを押した今回の実行で読み込んだばかりなので、読み直さない）
         merged = pd.concat(
-            [shifts_df_latest, auto_df[["date", "staff_id", "start_time", "end_time", "source"]]],
+            [shifts_df, auto_df[["date", "staff_id", "start_time", "end_time", "source"]]],
             ignore_index=True,
         )
 
@@ -1827,6 +2059,7 @@ def page_auto_scheduler(current_staff):
 
         # 提案はクリアしておく（次に開いたとき二重に見えないように）
         st.session_state.pop("auto_shift_proposal_v2", None)
+        _auto_assign_cached.clear()
 
         st.success("自動シフト案をシフトファイルに反映しました。")
         st.rerun()
@@ -1864,19 +2097,20 @@ def page_timecard(current_staff):
         if st.button("退勤", use_container_width=True) and not existing_today.empty:
             idx = existing_today.index[0]
             if pd.isna(timecards_df.loc[idx, "clock_out"]):
-                fmt = "%H:%M:%S"
-                start_t = dt.datetime.strptime(timecards_df.loc[idx, "clock_in"], fmt)
+                # 出勤時刻（HH:MM:SS）を今日の日付と組み合わせて datetime にする
+                clock_in_t = dt.datetime.strptime(timecards_df.loc[idx, "clock_in"], "%H:%M:%S").time()
+                start_dt = dt.datetime.combine(now.date(), clock_in_t)
                 end_t = now
                 
                 # 時間計算
-                diff_h = (end_t - start_t.replace(year=end_t.year, month=end_t.month, day=end_t.day)).total_seconds() / 3600
+                diff_h = (end_t - start_dt).total_seconds() / 3600
                 if diff_h < 0: diff_h += 24
                 
                 # 休憩・深夜計算
                 break_h = 1.0 if diff_h > 8 else (0.75 if diff_h > 6 else 0.0)
                 net_h = max(0, diff_h - break_h)
-                limit_22 = start_t.replace(hour=22, minute=0, second=0, year=end_t.year, month=end_t.month, day=end_t.day)
-                late_h = max(0, (end_t - max(start_t.replace(year=end_t.year, month=end_t.month, day=end_t.day), limit_22)).total_seconds() / 3600)
+                limit_22 = start_dt.replace(hour=22, minute=0, second=0)
+                late_h = max(0, (end_t - max(start_dt, limit_22)).total_seconds() / 3600)
                 
                 # 【修正ポイント】数値変換を安全に行う
                 wage = int(current_staff["hourly_wage"])
@@ -1894,7 +2128,7 @@ def page_timecard(current_staff):
     my_records = timecards_df[timecards_df["staff_id"] == sid].sort_values("date", ascending=False)
     if not my_records.empty:
         st.metric("今月の総支給額（概算）", f"{int(my_records['pay'].sum()):,} 円")
-        st.dataframe(my_records, use_container_width=True)
+        st.dataframe(my_records[tc_cols], use_container_width=True)
 
 # =========================
 # 連絡ボード（簡易チャット）
@@ -1914,17 +2148,13 @@ def page_message_board(current_staff):
     )
 
     # 宛先
-    to_options = ["全員に送信"] + [
-        get_staff_label(row) for _, row in STAFF_DF.iterrows()
-    ]
+    # ラベル → staff_id の対応表を先に作っておき、逆引きは dict で行う
+    label_to_id: dict[str, str] = {}
+    for rec in _STAFF_BY_ID.values():
+        label_to_id.setdefault(get_staff_label(rec), rec["staff_id"])
+    to_options = ["全員に送信"] + list(label_to_id)
     to_choice = st.selectbox("宛先", to_options)
-    to_staff_id = None
-    if to_choice != "全員に送信":
-        # ラベルから staff_id を逆引き
-        for _, row in STAFF_DF.iterrows():
-            if get_staff_label(row) == to_choice:
-                to_staff_id = row["staff_id"]
-                break
+    to_staff_id = label_to_id.get(to_choice)
 
     msg = st.text_area("メッセージ内容", "")
 
@@ -1939,11 +2169,9 @@ def page_message_board(current_staff):
                 "category": category,
                 "message": msg,
             }
-            messages_df = pd.concat(
-                [messages_df, pd.DataFrame([new_row])],
-                ignore_index=True,
-            )
-            save_csv(messages_df, MESSAGE_FILE)
+            append_row_csv(messages_df, MESSAGE_FILE, new_row, FILE_SCHEMA["messages"])
+            # 下の一覧にもすぐ出るように、表示用の DataFrame にも足しておく
+            messages_df.loc[len(messages_df)] = new_row
             st.success("メッセージを送信しました。")
 
     st.markdown("---")
@@ -1951,22 +2179,9 @@ def page_message_board(current_staff):
 
     # 自分に関係あるメッセージだけ表示する仕様にしても良いが、
     # ひとまず全件表示（後でフィルタ追加）
-    merged = messages_df.merge(
-        STAFF_DF[["staff_id", "name"]].rename(
-            columns={"staff_id": "from_staff_id", "name": "from_name"}
-        ),
-        on="from_staff_id",
-        how="left",
-    )
-    merged = merged.merge(
-        STAFF_DF[["staff_id", "name"]].rename(
-            columns={"staff_id": "to_staff_id", "name": "to_name"}
-        ),
-        on="to_staff_id",
-        how="left",
-    )
-
-    merged["to_name"] = merged["to_name"].fillna("全員")
+    merged = messages_df.copy()
+    merged["from_name"] = merged["from_staff_id"].map(_STAFF_NAME_MAP)
+    merged["to_name"] = merged["to_staff_id"].map(_STAFF_NAME_MAP).fillna("全員")
     merged = merged.sort_values("timestamp", ascending=False)
 
     show_cols = [
@@ -1982,17 +2197,173 @@ def page_message_board(current_staff):
 # =========================
 # 管理者設定（ダミー・今後拡張用）
 # =========================
+# 固定休の選択肢（先頭は「設定なし」）と、ラベル → 位置の対応表
+WEEKDAY_LABELS = ("月", "火", "水", "木", "金", "土", "日")
+DAYOFF_CHOICES = ("（設定なし）", *WEEKDAY_LABELS)
+DAYOFF_INDEX = {label: i for i, label in enumerate(DAYOFF_CHOICES)}
+
+# 区分 / ポジションの選択肢と、ラベル → 位置の対応表
+ROLE_OPTIONS = ["社員", "アルバイト"]
+ROLE_INDEX = {role: i for i, role in enumerate(ROLE_OPTIONS)}
+POSITION_OPTIONS = {
+    "社員": ["店長", "料理長", "社員"],
+    "アルバイト": ["調理場担当", "ホール担当", "オールラウンド"],
+}
+POSITION_INDEX = {
+    role: {pos: i for i, pos in enumerate(pos_list)}
+    for role, pos_list in POSITION_OPTIONS.items()
+}
+
+
+# 管理者設定のスタッフ一覧の列表示（毎回作らないように定数にしておく）
+STAFF_TABLE_COLUMN_CONFIG = {
+    "staff_id": st.column_config.TextColumn("ID", width="small"),
+    "name": st.column_config.TextColumn("名前"),
+    "role": st.column_config.TextColumn("区分", width="small"),
+    "position": st.column_config.TextColumn("ポジション"),
+    "hourly_wage": st.column_config.NumberColumn("時給", format="%d"),
+    "desired_shifts_per_month": st.column_config.NumberColumn("月希望回数", format="%d"),
+    "desired_shifts_per_week": st.column_config.NumberColumn("週希望回数", format="%d"),
+    "desired_monthly_income": st.column_config.NumberColumn("月希望収入", format="%d"),
+}
+
+
 def generate_new_staff_id(df: pd.DataFrame, role: str) -> str:
     prefix = "S" if role == "社員" else "A"
-    existing = [
-        int(s[1:])
-        for s in df["staff_id"].tolist()
-        if isinstance(s, str) and s.startswith(prefix) and s[1:].isdigit()
-    ]
-    next_num = max(existing) + 1 if existing else 1
+    # 「接頭辞 + 数字」の ID だけを取り出して番号の最大値を求める（文字列操作は列単位で）
+    s = df["staff_id"].astype("string")
+    nums_str = s.str[1:]
+    m = (s.str.startswith(prefix) & nums_str.str.isdigit()).fillna(False)
+    nums = pd.to_numeric(nums_str[m], errors="coerce").dropna()
+    next_num = int(nums.max()) + 1 if not nums.empty else 1
     return f"{prefix}{next_num:03d}"
 
 
+def _render_dayoffs(row, staff_id: str) -> tuple[str, str]:
+    """社員の固定休1 / 固定休2 の選択欄を出して、選ばれたラベルを返す"""
+    labels = []
+    for n in (1, 2):
+        v = getattr(row, f"dayoff{n}", None)
+        default_label = "（設定なし）"
+        if not pd.isna(v):
+            try:
+                default_label = WEEKDAY_LABELS[int(v)]
+            except Exception:
+                pass
+
+        labels.append(
+            st.selectbox(
+                f"固定休{n}",
+                DAYOFF_CHOICES,
+                index=DAYOFF_INDEX[default_label],
+                key=f"dayoff{n}_{staff_id}",
+            )
+        )
+    return labels[0], labels[1]
+
+
+def _staff_editor(row, hourly_default: int, month_val: int, week_val: int, income_default: int):
+    """
+    スタッフ1人分の編集欄（page_admin_settings の st.form の中で呼ぶ）。
+    フォームの中なので、入力を変えても保存ボタンを押すまで再実行されない。
+    """
+    staff_id = row.staff_id
+    with st.expander(f"{row.staff_id} : {row.name}（{row.role}）", expanded=False):
+        # 名前
+        name = st.text_input(
+            "名前",
+            value=row.name,
+            key=f"name_{staff_id}",
+        )
+
+        # 区分（社員 / アルバイト）
+        role = st.selectbox(
+            "区分",
+            ROLE_OPTIONS,
+            index=ROLE_INDEX.get(row.role, ROLE_INDEX["アルバイト"]),
+            key=f"role_{staff_id}",
+        )
+
+        # ポジション（役職・担当）
+        pos_list = POSITION_OPTIONS[role]
+        # 一覧に無いポジションのデフォルトは最後（例: 社員→「社員」、アルバイト→「オールラウンド」）
+        cur_pos = getattr(row, "position", None)
+        pos_index = POSITION_INDEX[role].get(cur_pos, len(pos_list) - 1)
+        position = st.selectbox(
+            "ポジション",
+            pos_list,
+            index=pos_index,
+            key=f"pos_{staff_id}",
+        )
+
+        # 時給
+        hourly = st.number_input(
+            "時給",
+            min_value=0,
+            max_value=10000,
+            step=50,
+            value=hourly_default,
+            key=f"wage_{staff_id}",
+        )
+
+        # 月あたり最大シフト回数（新仕様）
+        # まずは desired_shifts_per_month を優先し、
+        # 空なら desired_shifts_per_week × 4 で初期値を作る
+        # 1. まずは desired_shifts_per_month を優先
+        month_cap_default = month_val
+
+        if month_cap_default < 0:
+            # 2. 無い場合は desired_shifts_per_week から推測
+            if week_val > 7:
+                # 旧UIで「月20回」を週カラムに入れていたケースを救済
+                month_cap_default = week_val
+            else:
+                month_cap_default = week_val * 4
+
+        # 3. number_input の制約に合わせてクリップ（0〜31）
+        if month_cap_default < 0:
+            month_cap_default = 0
+        if month_cap_default > 31:
+            month_cap_default = 31
+
+        month_cap = st.number_input(
+            "月あたり最大シフト回数",
+            min_value=0,
+            max_value=31,
+            step=1,
+            value=month_cap_default,
+            key=f"monthcap_{staff_id}",
+        )
+
+        # 月希望収入（目安）
+        income = st.number_input(
+            "月希望収入（目安）",
+            min_value=0,
+            max_value=1_000_000,
+            step=10_000,
+            value=income_default,
+            key=f"income_{staff_id}",
+        )
+
+        # 固定休（社員のみ。アルバイトは選択欄を出さずに「設定なし」）
+        if role == "社員":
+            d1_label, d2_label = _render_dayoffs(row, staff_id)
+        else:
+            d1_label = d2_label = "（設定なし）"
+
+        # 一旦セッションに保存（staff_id ごとの dict を1つのキーにまとめて持つ）
+        st.session_state.setdefault("staff_cfg", {})[staff_id] = {
+            "name": name,
+            "role": role,
+            "position": position,
+            "hourly_wage": hourly,
+            "month_cap": month_cap,   # ←ここ
+            "income": income,
+            "dayoff1_label": d1_label,
+            "dayoff2_label": d2_label,
+        }
+
+
 # =========================
 def page_admin_settings(current_staff):
     # 【修正箇所】関数の最初でglobal宣言を行う（必須）
@@ -2004,10 +2375,11 @@ def page_admin_settings(current_staff):
         st.warning("管理者設定は社員のみ利用できます。")
         return
 
-    # 現在のデータをコピーして編集用にする
-    staff_df = STAFF_DF.copy()
+    # 表示や選択肢に使うだけなので、毎回コピーはしない
+    # （追加・削除では新しい DataFrame を作り、編集内容の保存時にだけコピーする）
+    staff_df = STAFF_DF
 
-    # 必要な列がなければデフォルト値で埋める
+    # 必要な列がなければデフォルト値で埋める（足りない時だけ新しい DataFrame を作る）
     defaults = {
         "desired_shifts_per_week": 0,   # 旧カラム（互換用）
         "desired_shifts_per_month": 0,  # 新カラム（本命）
@@ -2017,11 +2389,10 @@ def page_admin_settings(current_staff):
         "dayoff2": pd.NA,
     }
 
-    for col, val in defaults.items():
-        if col not in staff_df.columns:
-            staff_df[col] = val
+    missing_cols = {col: val for col, val in defaults.items() if col not in staff_df.columns}
+    if missing_cols:
+        staff_df = staff_df.assign(**missing_cols)
 
-    weekday_labels = ["月", "火", "水", "木", "金", "土", "日"]
     weekday_label_to_value = {
         "月": 0,
         "火": 1,
@@ -2032,11 +2403,8 @@ def page_admin_settings(current_staff):
         "日": 6,
     }
 
-    role_options = ["社員", "アルバイト"]
-    position_options = {
-        "社員": ["店長", "料理長", "社員"],
-        "アルバイト": ["調理場担当", "ホール担当", "オールラウンド"],
-    }
+    role_options = ROLE_OPTIONS
+    position_options = POSITION_OPTIONS
 
     st.subheader("現在のスタッフ一覧")
 
@@ -2060,209 +2428,85 @@ def page_admin_settings(current_staff):
     if "desired_monthly_income" in staff_df.columns:
         display_cols.append("desired_monthly_income")
 
-    st.dataframe(
+    # 閲覧専用の data_editor にしておくと、内容が変わらない再実行では表を丸ごと送り直さない
+    st.data_editor(
         staff_df[display_cols],
         use_container_width=True,
         height=250,
+        hide_index=True,
+        column_config=STAFF_TABLE_COLUMN_CONFIG,
+        disabled=True,
+        num_rows="fixed",
+        key="roster",
     )
 
     # ---------------- スタッフ情報の編集 ----------------
     st.markdown("---")
     st.subheader("スタッフ情報の編集（名前・区分・ポジションなど）")
 
-    for idx, row in staff_df.iterrows():
-        staff_id = row["staff_id"]
-        with st.expander(f"{row['staff_id']} : {row['name']}（{row['role']}）", expanded=False):
-            # 名前
-            name = st.text_input(
-                "名前",
-                value=row["name"],
-                key=f"name_{staff_id}",
-            )
-
-            # 区分（社員 / アルバイト）
-            cur_role = row["role"] if row["role"] in role_options else "アルバイト"
-            role = st.selectbox(
-                "区分",
-                role_options,
-                index=role_options.index(cur_role),
-                key=f"role_{staff_id}",
-            )
+    # 数値の列は読み込み時に Int32 になっているので、欠損を既定値で埋めるだけでよい
+    def _int_col(col: str, default: int) -> list[int]:
+        return staff_df[col].fillna(default).astype(int).tolist()
 
-            # ポジション（役職・担当）
-            pos_list = position_options[role]
-            cur_pos = row.get("position")
-            if not isinstance(cur_pos, str) or cur_pos not in pos_list:
-                # デフォルトは最後（例: 社員→「社員」、アルバイト→「オールラウンド」）
-                cur_pos = pos_list[-1]
-            position = st.selectbox(
-                "ポジション",
-                pos_list,
-                index=pos_list.index(cur_pos),
-                key=f"pos_{staff_id}",
-            )
-
-            # 時給
-            hourly = int(row.get("hourly_wage") or 0)
-            hourly = st.number_input(
-                "時給",
-                min_value=0,
-                max_value=10000,
-                step=50,
-                value=hourly,
-                key=f"wage_{staff_id}",
-            )
+    hourly_vals = _int_col("hourly_wage", 0)
+    month_vals = _int_col("desired_shifts_per_month", -1)
+    week_vals = _int_col("desired_shifts_per_week", 0)
+    income_vals = _int_col("desired_monthly_income", 0)
 
-            # 月あたり最大シフト回数（新仕様）
-            # まずは desired_shifts_per_month を優先し、
-            # 空なら desired_shifts_per_week × 4 で初期値を作る
-            raw_month = row.get("desired_shifts_per_month")
-
-            def _to_int_safe(x, default=0):
-                try:
-                    if pd.isna(x) or x == "":
-                        return default
-                    return int(x)
-                except Exception:
-                    return default
-
-            # 1. まずは desired_shifts_per_month を優先
-            month_cap_default = _to_int_safe(raw_month, default=-1)
-
-            if month_cap_default < 0:
-                # 2. 無い場合は desired_shifts_per_week から推測
-                raw_week = row.get("desired_shifts_per_week")
-                week_val = _to_int_safe(raw_week, default=0)
-
-                if week_val > 7:
-                    # 旧UIで「月20回」を週カラムに入れていたケースを救済
-                    month_cap_default = week_val
-                else:
-                    month_cap_default = week_val * 4
-
-            # 3. number_input の制約に合わせてクリップ（0〜31）
-            if month_cap_default < 0:
-                month_cap_default = 0
-            if month_cap_default > 31:
-                month_cap_default = 31
-
-            month_cap = st.number_input(
-                "月あたり最大シフト回数",
-                min_value=0,
-                max_value=31,
-                step=1,
-                value=month_cap_default,
-                key=f"monthcap_{staff_id}",
-            )
-
-            # 月希望収入（目安）
-            raw_income = row.get("desired_monthly_income", 0)
-
-            # NA や空文字でも落ちないように安全に変換
-            if pd.isna(raw_income) or raw_income == "":
-                income_default = 0
-            else:
-                try:
-                    income_default = int(raw_income)
-                except Exception:
-                    income_default = 0
-
-            income = st.number_input(
-                "月希望収入（目安）",
-                min_value=0,
-                max_value=1_000_000,
-                step=10_000,
-                value=income_default,
-                key=f"income_{staff_id}",
-            )
+    # 編集欄はまとめて1つのフォームにして、入力のたびにページ全体が再実行されないようにする
+    with st.form("edit_staff"):
+        st.caption("※ 区分を変更した場合、ポジション・固定休は保存後にあらためて選び直してください。")
 
-            # 固定休（社員のみ）
-            if role == "社員":
-                # dayoff1
-                v1 = row.get("dayoff1")
-                if pd.isna(v1):
-                    default_label1 = "（設定なし）"
-                else:
-                    try:
-                        default_label1 = weekday_labels[int(v1)]
-                    except Exception:
-                        default_label1 = "（設定なし）"
-
-                d1_label = st.selectbox(
-                    "固定休1",
-                    ["（設定なし）"] + weekday_labels,
-                    index=(["（設定なし）"] + weekday_labels).index(default_label1),
-                    key=f"dayoff1_{staff_id}",
-                )
+        # iterrows は1行ごとに Series を作るので、namedtuple で回す
+        for row, hourly_default, month_val, week_val, income_default in zip(
+            staff_df.itertuples(index=False), hourly_vals, month_vals, week_vals, income_vals
+        ):
+            _staff_editor(row, hourly_default, month_val, week_val, income_default)
 
-                # dayoff2
-                v2 = row.get("dayoff2")
-                if pd.isna(v2):
-                    default_label2 = "（設定なし）"
-                else:
-                    try:
-                        default_label2 = weekday_labels[int(v2)]
-                    except Exception:
-                        default_label2 = "（設定なし）"
-
-                d2_label = st.selectbox(
-                    "固定休2",
-                    ["（設定なし）"] + weekday_labels,
-                    index=(["（設定なし）"] + weekday_labels).index(default_label2),
-                    key=f"dayoff2_{staff_id}",
-                )
-            else:
-                d1_label = "（設定なし）"
-                d2_label = "（設定なし）"
-
-            # 一旦セッションに保存
-            st.session_state[f"cfg_staff_{staff_id}"] = {
-                "name": name,
-                "role": role,
-                "position": position,
-                "hourly_wage": hourly,
-                "month_cap": month_cap,   # ←ここ
-                "income": income,
-                "dayoff1_label": d1_label,
-                "dayoff2_label": d2_label,
-            }
+        # --- 保存実行ボタン ---
+        submitted = st.form_submit_button("スタッフ編集内容を保存")
 
-    # --- 保存実行ボタン ---
-    if st.button("スタッフ編集内容を保存"):
+    if submitted:
         # global宣言は関数の最初で行っている前提ですが、念のためここでも確認
         # (エラーが出る場合は、この関数の1行目に global STAFF_DF を置いてください)
 
         # 1. セッションから編集内容を反映させるための新しい器を用意
         new_staff_df = STAFF_DF.copy()
 
-        for idx, row in new_staff_df.iterrows():
-            staff_id = row["staff_id"]
-            cfg = st.session_state.get(f"cfg_staff_{staff_id}")
-            if not cfg: 
-                continue
+        # 編集内容を行の並び順で集めて、列単位でまとめて書き込む
+        # （staff_id が重複していても行の位置で対応させる）
+        staff_cfg = st.session_state.get("staff_cfg", {})
+        row_cfgs = [staff_cfg.get(sid) for sid in new_staff_df["staff_id"]]
+        rows = np.array([bool(cfg) for cfg in row_cfgs], dtype=bool)
+        edits = pd.DataFrame([cfg for cfg in row_cfgs if cfg])
+        if not edits.empty:
 
             # 各値を反映
-            new_staff_df.at[idx, "name"] = cfg["name"]
-            new_staff_df.at[idx, "role"] = cfg["role"]
-            new_staff_df.at[idx, "position"] = cfg["position"]
-            new_staff_df.at[idx, "hourly_wage"] = int(cfg["hourly_wage"])
-            new_staff_df.at[idx, "desired_shifts_per_month"] = int(cfg["month_cap"])
-            new_staff_df.at[idx, "desired_monthly_income"] = int(cfg["income"])
-
-            # 固定休の反映
-            if cfg["role"] == "社員":
-                l1, l2 = cfg["dayoff1_label"], cfg["dayoff2_label"]
-                new_staff_df.at[idx, "dayoff1"] = weekday_label_to_value[l1] if l1 in weekday_label_to_value else pd.NA
-                new_staff_df.at[idx, "dayoff2"] = weekday_label_to_value[l2] if l2 in weekday_label_to_value else pd.NA
-            else:
-                new_staff_df.at[idx, "dayoff1"] = pd.NA
-                new_staff_df.at[idx, "dayoff2"] = pd.NA
+            updates = {
+                "name": edits["name"],
+                "role": edits["role"],
+                "position": edits["position"],
+                "hourly_wage": edits["hourly_wage"].astype(int),
+                "desired_shifts_per_month": edits["month_cap"].astype(int),
+                "desired_monthly_income": edits["income"].astype(int),
+            }
+
+            # 固定休の反映（社員のみ。「設定なし」やアルバイトは NA）
+            is_emp = edits["role"] == "社員"
+            for col, label_col in (("dayoff1", "dayoff1_label"), ("dayoff2", "dayoff2_label")):
+                updates[col] = (
+                    edits[label_col].map(weekday_label_to_value).astype("Int8").where(is_emp)
+                )
+
+            for col, values in updates.items():
+                new_staff_df.loc[rows, col] = values.to_numpy()
 
         # 2. 【ループの外】全員分の処理が終わってから、一度だけ保存する
         save_csv(new_staff_df, STAFF_FILE)
         
         # 3. アプリ全体のデータ(本尊)を更新
         STAFF_DF = new_staff_df
+        _rebuild_staff_indexes()
         
         st.success("スタッフ情報を保存し、Google Sheetsと同期しました！")
         st.rerun()
@@ -2334,12 +2578,16 @@ def page_admin_settings(current_staff):
                     "dayoff2": pd.NA,
                 }
 
-                staff_df = pd.concat(
-                    [staff_df, pd.DataFrame([new_row])],
-                    ignore_index=True,
-                )
-                staff_df.to_csv(STAFF_FILE, index=False, encoding="utf-8-sig")
+                # 元の STAFF_DF は書き込みが成功するまで触らないよう、コピーの末尾に直接追加する
+                # （load_csv で読んだ STAFF_DF は RangeIndex なので len がそのまま新しいラベルになる）
+                staff_df = staff_df.copy()
+                staff_df.loc[len(staff_df)] = new_row
+                # 1行追加で object 型に広がった整数列を、読み込み時と同じ型に戻しておく
+                staff_df = staff_df.astype(STAFF_NULLABLE_DTYPES)
+                _fast_write_csv(staff_df, STAFF_FILE)
+                _load_csv_cached.clear()
                 STAFF_DF = staff_df
+                _rebuild_staff_indexes()
                 st.success(f"スタッフ {new_name}（{new_id}）を追加しました。")
                 st.rerun()
     st.markdown("---")
@@ -2350,7 +2598,6 @@ def page_admin_settings(current_staff):
 
     if st.button("この年月の削除済みスタッフのシフトを削除する"):
         active_ids = get_active_staff_ids()
-        ym_prefix = f"{int(year_clean):04d}-{int(month_clean):02d}-"
 
         shifts_df = load_csv(
             SHIFT_FILE,
@@ -2358,8 +2605,13 @@ def page_admin_settings(current_staff):
         )
 
         before = len(shifts_df)
-        mask_target_month = shifts_df["date"].str.startswith(ym_prefix)
-        mask_deleted_staff = ~shifts_df["staff_id"].astype(str).isin(active_ids)
+        # 読み込み時に作ってある日付型の列（_date）で、年・月を整数として比較する
+        mask_target_month = (
+            (shifts_df["_date"].dt.year == int(year_clean))
+            & (shifts_df["_date"].dt.month == int(month_clean))
+        )
+        # staff_id は読み込み時に文字列へそろえてあるので、そのまま集合で判定
+        mask_deleted_staff = ~shifts_df["staff_id"].isin(active_ids)
         shifts_df = shifts_df[~(mask_target_month & mask_deleted_staff)]
         after = len(shifts_df)
 
@@ -2379,14 +2631,17 @@ def page_admin_settings(current_staff):
         st.info("削除できるスタッフがいません。")
         return
 
-    def format_staff_label(sid: str) -> str:
-        row = staff_df[staff_df["staff_id"] == sid].iloc[0]
-        return f"{sid} : {row['name']}（{row['role']}）"
+    # 表示ラベルは列単位の文字列連結で一度に作っておく（選択肢ごとに全件検索しない）
+    label_map = dict(zip(
+        staff_df["staff_id"],
+        staff_df["staff_id"].astype(str) + " : " + staff_df["name"].astype(str)
+        + "（" + staff_df["role"].astype(str) + "）",
+    ))
 
     delete_ids = st.multiselect(
         "削除するスタッフを選択（※過去のシフトには名前が表示されなくなります）",
         options=choices,
-        format_func=format_staff_label,
+        format_func=label_map.__getitem__,
         key="delete_staff_ids",
     )
 
@@ -2395,8 +2650,10 @@ def page_admin_settings(current_staff):
             st.info("削除するスタッフが選択されていません。")
         else:
             staff_df = staff_df[~staff_df["staff_id"].isin(delete_ids)]
-            staff_df.to_csv(STAFF_FILE, index=False, encoding="utf-8-sig")
+            _fast_write_csv(staff_df, STAFF_FILE)
+            _load_csv_cached.clear()
             STAFF_DF = staff_df
+            _rebuild_staff_indexes()
             st.success(f"{len(delete_ids)} 名のスタッフを削除しました。")
             st.rerun()
 
@@ -2438,6 +2695,8 @@ def main():
 
     # 2. ログイン後のサイドバー共通表示
     st.sidebar.title("🍷 TSCTメニュー")
+    report_gsheets_connection_error()
+    _report_gsheets_sync()
     
     # ログアウトボタン
     if st.sidebar.button("🔓 ログアウト"):